@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Baseline de violações (--baseline arquivo): a primeira execução grava as violações do projeto e as
+#   seguintes apresentam somente as violações novas e as resolvidas em relação a ela.
+
+import csv
+import hashlib
+from collections import defaultdict
+from report import export_csv
+
+HEAD = ['fingerprint', 'design problem', 'app', 'module', 'class', 'function']
+
+
+class Fingerprints():
+    '''
+        Identificador de cada violação sem a linha, para que um trecho inserido acima de uma violação
+            não a apresente como nova.
+
+        As violações de um mesmo tipo na mesma função são diferenciadas pela ordem em que são
+            encontradas: a primeira, a segunda etc.
+    '''
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def fingerprint(self, violation):
+        '''
+            Retorna o identificador e os campos que o compõem (tipo, app, nome completo do módulo, classe e
+                função). O segundo nível do módulo não basta: app/views/a.py e app/views/b.py têm o mesmo.
+        '''
+        group = (violation.smell, violation.app, violation.key, violation.cls or '-', violation.method or '-')
+        occurrence = self.counts[group]
+        self.counts[group] += 1
+        value = ';'.join(group + ('{}'.format(occurrence),))
+        return hashlib.sha1(value.encode('utf8')).hexdigest()[:16], group
+
+
+def load_baseline(filename):
+    '''
+        Campos de cada violação da baseline indexados pelo identificador.
+    '''
+    reader = csv.reader(open(filename, 'rb'))
+    next(reader, None)
+    baseline = {}
+    for row in reader:
+        if row:
+            baseline[row[0].decode('utf8')] = [field.decode('utf8') for field in row[1:]]
+    return baseline
+
+
+def save_baseline(violations, filename):
+    '''
+        Grava a baseline ordenada, para que as alterações no arquivo versionado sejam legíveis.
+            Retorna as violações, à medida que são gravadas.
+    '''
+    fingerprints = Fingerprints()
+    rows = []
+    for violation in violations:
+        fingerprint, group = fingerprints.fingerprint(violation)
+        rows.append([fingerprint] + list(group))
+        yield violation
+    rows.sort(key=lambda row: row[2:] + row[1:2] + row[:1])
+    export_csv(HEAD, rows, filename)
+
+
+def compare_baseline(violations, baseline):
+    '''
+        Violações que não estão na baseline e campos das violações da baseline que não foram encontradas.
+            Somente as violações novas são mantidas em memória.
+    '''
+    fingerprints = Fingerprints()
+    found = set()
+    added = []
+    for violation in violations:
+        fingerprint, group = fingerprints.fingerprint(violation)
+        if baseline.has_key(fingerprint):
+            found.add(fingerprint)
+        else:
+            added.append(violation)
+    resolved = [baseline[fingerprint] for fingerprint in sorted(set(baseline) - found, key=lambda key: baseline[key][1:])]
+    return added, resolved
@@ -1,47 +1,160 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import io
 import ast
+import tokenize
+import multiprocessing
+from collections import OrderedDict
+from identifier import LAYERS
+from report import LAYERS as REPORT_LAYERS
 from converter import SourceToAST
-from complexity import McCabeComplexity
-from checker import SQLComplexity
+from checker import complexities, get_jobs
+from cache import get_cache
 
-def get_LOC(filename):
-    loc = 0
-    codelines = open(filename.__str__())
-    check_next_line = True
-    for line in codelines:
-        try:
-            if check_next_line:
-                if line.isspace() or line.strip().startswith('#'):
-                    pass
-                elif line.strip().startswith('\'\'\' ') or line.strip().startswith('\"\"\" '):
-                    check_next_line = False
-                else:
-                    loc += 1
-            elif line.strip().endswith('\'\'\'') or line.strip().endswith('\"\"\"'):
-                check_next_line = True
-        except UnicodeDecodeError:
-            pass
-    return loc
+# linhas contadas em cada módulo pelo subcomando loc
+LINES = ('código', 'comentários', 'em branco', 'docstrings')
 
 
-def get_metrics(config, files):
-    files_to_converter = []
+def count_lines(source):
+    '''
+        Linhas de código, de comentário, em branco e de docstring do código fonte, em uma única passada pelos tokens.
+            Uma string que forma sozinha uma instrução (docstring ou bloco de texto) conta como docstring, e uma
+            linha com código e comentário conta como código.
+    '''
+    lines = io.BytesIO(source).readlines()
+    code = set()
+    comment = set()
+    docstring = set()
+    # linhas da string que inicia a instrução atual, None se a instrução não começou com uma string
+    text = None
+    statement = True
+    try:
+        for kind, value, (start, _), (end, _), line in tokenize.generate_tokens(iter(lines).next):
+            if kind == tokenize.COMMENT:
+                comment.add(start)
+            elif kind == tokenize.NEWLINE:
+                if text:
+                    docstring.update(text)
+                text = None
+                statement = True
+            elif kind == tokenize.STRING and (statement or text is not None):
+                # strings concatenadas continuam a mesma instrução
+                text = (text or set()) | set(range(start, end + 1))
+                statement = False
+            elif kind not in (tokenize.NL, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+                if text:
+                    code.update(text)
+                text = None
+                code.update(range(start, end + 1))
+                statement = False
+    except (tokenize.TokenError, IndentationError):
+        # código incompleto, as linhas após o erro não são classificadas
+        pass
+    docstring -= code
+    comment -= code | docstring
+    return [len(code), len(comment), len(lines) - len(code) - len(comment) - len(docstring), len(docstring)]
+
+
+def get_LOC(config, identifier, converter=None):
+    '''
+        Linhas de cada módulo das camadas identificadas (a primeira camada do arquivo) e o total de cada camada.
+            Usa o código fonte já lido pelo converter, sem convertê-lo em AST.
+        Retorna as linhas [módulo, camada] + count_lines e camada -> totais, na ordem de identifier.LAYERS.
+    '''
+    files = [filename for filename in identifier.files if identifier.layers.has_key(filename)]
+    converter = converter or SourceToAST(config)
+    nodes = converter.load(files)
+    cache = get_cache(config)
+    modules = []
+    totals = OrderedDict((layer, [0] * len(LINES)) for layer in LAYERS)
     for filename in files:
-        if 'admin' in filename or 'views' in filename or 'forms' in filename or 'models' in filename:
-            files_to_converter.append(filename)
-    converter = SourceToAST(config)
-    nodes = converter.parse(files_to_converter)
-    methods = {}
-    functions = {}
+        key = converter.module_name(filename)
+        record = cache and cache.get('loc', key, nodes.digest(key))
+        if not record:
+            record = {'lines': count_lines(nodes.sources[key])}
+            if cache:
+                cache.set('loc', key, nodes.digest(key), record)
+        layer = identifier.layers[filename][0]
+        modules.append([key, layer] + record['lines'])
+        totals[layer] = [total + count for total, count in zip(totals[layer], record['lines'])]
+    return modules, OrderedDict((layer, total) for layer, total in totals.items() if any(total))
+
+
+def get_metrics(config, identifier, converter=None, summary=None):
+    '''
+        Métricas das funções dos módulos das camadas do resumo (report.LAYERS), identificadas como no checker.
+        summary, se informado, recebe o número de módulos com o conteúdo idêntico a outro ('duplicates').
+        
+        Como no checker, o AST de cada módulo é descartado depois do cálculo, exceto os dos modelos e
+            managers, usados nos relacionamentos.
+    '''
+    files = [filename for filename in identifier.files
+             if any(layer in REPORT_LAYERS for layer in identifier.layers.get(filename, ()))]
+    converter = converter or SourceToAST(config)
+    nodes = converter.load(files)
+    kept = set(converter.module_name(filename) for filename in files
+               if 'models' in identifier.layers[filename] or 'managers' in identifier.layers[filename])
+    cache = get_cache(config)
+    records = {}
+    pending = []
+    # as métricas não dependem do nome do módulo, módulos com o mesmo conteúdo são calculados uma única vez
+    contents = {}
+    duplicates = {}
     for key in nodes.keys():
-        metrics = Metrics(key)
-        metrics.visit(nodes[key])
-        if len(metrics.methods) > 0:
-            methods.update(metrics.methods)
-        if len(metrics.functions) > 0:
-            functions.update(metrics.functions)
-    return methods, functions
+        record = cache and cache.get('metrics', key, nodes.digest(key))
+        if record:
+            records[key] = record
+        elif contents.has_key(nodes.digest(key)):
+            duplicates[key] = contents[nodes.digest(key)]
+        else:
+            contents[nodes.digest(key)] = key
+            pending.append(key)
+    jobs = get_jobs(config)
+    if jobs > 1 and len(pending) > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.map(metrics_task, [(key, nodes.sources[key]) for key in pending],
+                           max(1, len(pending) // (jobs * 4)))
+        pool.close()
+        pool.join()
+        calculated = []
+        for record, mccabe, sql in results:
+            # as complexidades calculadas nos processos são reaproveitadas pelo checker
+            complexities.update(mccabe, sql)
+            calculated.append(record)
+    else:
+        calculated = []
+        for key in pending:
+            calculated.append(calcule_metrics(key, nodes[key]))
+            if key not in kept:
+                nodes.release(key)
+    for key, record in zip(pending, calculated):
+        records[key] = record
+        if cache:
+            cache.set('metrics', key, nodes.digest(key), record)
+    for key, original in duplicates.items():
+        records[key] = {'functions': records[original]['functions']}
+        if cache:
+            cache.set('metrics', key, nodes.digest(key), records[key])
+    if summary is not None:
+        summary['duplicates'] = len(duplicates)
+    # pares (módulo, funções), as funções são linhas [classe, função, mccabe, sql] (report.metrics_table)
+    return [(key, records[key]['functions']) for key in nodes.keys()]
+
+
+def calcule_metrics(module, node):
+    metrics = Metrics(module)
+    metrics.visit(node)
+    # na ordem de inserção, para que a junção dos resultados seja idêntica à execução serial
+    return {'functions': [[cls, name, mccabe, sql] for (cls, name), (mccabe, sql) in metrics.functions.items()]}
+
+
+def metrics_task(task):
+    '''
+        Retorna também as complexidades das funções do módulo, que são enviadas ao processo principal.
+    '''
+    module, source = task
+    complexities.clear()
+    return calcule_metrics(module, ast.parse(source)), complexities.mccabe, complexities.sql
         
 
 class Metrics(ast.NodeVisitor):
@@ -49,8 +162,8 @@ class Metrics(ast.NodeVisitor):
     def __init__(self, module):
         self.reset()
         self.module = module
-        self.methods = {}
-        self.functions = {}
+        # (classe, função) -> (mccabe, sql), classe None nas funções do módulo
+        self.functions = OrderedDict()
     
     def reset(self):
         self.class_name = None
@@ -63,12 +176,7 @@ class Metrics(ast.NodeVisitor):
         self.reset()
             
     def visit_FunctionDef(self, node):
-        codigo = McCabeComplexity().calcule(node)
-        sql = SQLComplexity().calcule(node)
-        if self.class_name:
-            key = '{}.{}.{}'.format(self.module, self.class_name, node.name)
-            self.methods[key] = '{};{}'.format(codigo, sql)
-        else:
-            key = '{}.{}'.format(self.module, node.name)
-            self.functions[key] = '{};{}'.format(codigo, sql)
+        codigo = complexities.calcule_mccabe(self.module, node)
+        sql = complexities.calcule_sql(self.module, node)
+        self.functions[(self.class_name, node.name)] = (codigo, sql)
 
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import json
+import hashlib
+
+# incrementar sempre que uma mudança na análise invalidar os resultados já armazenados
+VERSION = '5'
+
+THRESHOLDS = ('max_mccabe_complexity', 'min_mccabe_complexity', 'max_sql_complexity', 'min_sql_complexity')
+
+
+def get_cache(config):
+    '''
+        Retorna o cache configurado no arquivo de configuração ou None se não houver.
+    '''
+    if config.has_key('cache') and config['cache'].strip():
+        return AnalysisCache(config['cache'].strip(), config)
+    return None
+
+
+def fingerprint(value):
+    '''
+        Hash de um valor serializável em json. Os objetos com serialize (ex.: checker.Relationship)
+            são convertidos por ele.
+    '''
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=serialize)).hexdigest()
+
+
+def serialize(value):
+    if hasattr(value, 'serialize'):
+        return value.serialize()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class AnalysisCache():
+    '''
+        Armazena em disco os resultados da análise de cada módulo.
+
+        Cada registro é identificado pelo tipo (views, models, metrics, loc, managers, symbols, relationships) e pelo
+            módulo, e só é válido para o mesmo hash do conteúdo, versão da ferramenta e limites de complexidade.
+    '''
+
+    def __init__(self, directory, config):
+        self.directory = directory
+        thresholds = [config.get(key, '') for key in THRESHOLDS]
+        self.salt = fingerprint([VERSION] + thresholds)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, kind, module):
+        return os.path.join(self.directory, kind, '{}.json'.format(module))
+
+    def get(self, kind, module, digest):
+        '''
+            Retorna o registro armazenado ou None se não existir ou estiver desatualizado.
+        '''
+        try:
+            record = json.load(open(self.path(kind, module)))
+        except (IOError, ValueError):
+            record = None
+        if record and record.get('digest') == digest and record.get('salt') == self.salt:
+            self.hits += 1
+            return record
+        self.misses += 1
+        return None
+
+    def set(self, kind, module, digest, record):
+        record['digest'] = digest
+        record['salt'] = self.salt
+        directory = os.path.join(self.directory, kind)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        json.dump(record, open(self.path(kind, module), 'w'))
+
+
+class MemoryCache():
+    '''
+        Mesma interface do AnalysisCache mantendo os registros em memória, usado pelo modo watch
+            para reavaliar somente os módulos alterados e os que dependem deles.
+    '''
+
+    def __init__(self):
+        self.records = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, module, digest):
+        record = self.records.get((kind, module))
+        if record and record['digest'] == digest:
+            self.hits += 1
+            return record
+        self.misses += 1
+        return None
+
+    def set(self, kind, module, digest, record):
+        record['digest'] = digest
+        self.records[(kind, module)] = record
+
+
+class Dependencies():
+    '''
+        Envolve um dicionário registrando as chaves consultadas, para que o resultado de um módulo
+            seja reavaliado somente quando uma delas mudar.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        self.used = set()
+
+    def has_key(self, key):
+        self.used.add(key)
+        return self.data.has_key(key)
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def __getitem__(self, key):
+        self.used.add(key)
+        return self.data[key]
+
+    def keys(self):
+        return self.data.keys()
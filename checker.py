@@ -1,130 +1,459 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import re
 import ast
+import multiprocessing
+import time
+import profiler
 from complexity import McCabeComplexity, HalsteadComplexity
+from cache import get_cache, fingerprint, Dependencies
+from converter import ModuleNodes
+from symbols import SymbolTable, mapping_symbols, import_target
 
 def checker(models, views, managers, config):
+    return list(iter_violations(models, views, managers, config))
+
+def iter_violations(models, views, managers, config, cache=None, only=None, consulted=None, summary=None):
+    '''
+        Gera as violações módulo a módulo, na mesma ordem da execução serial.
+        only restringe os módulos verificados (os relacionamentos usam sempre todos os modelos) e
+            consulted, se informado, recebe as chaves dos relacionamentos consultadas por cada módulo.
+        summary, se informado, recebe o número de módulos com o conteúdo idêntico a outro ('duplicates'),
+            que reaproveitam as violações dele (ver content_key).
+        
+        O AST de cada view é descartado depois da verificação, somente os modelos (usados nos
+            relacionamentos) permanecem em memória durante toda a análise.
+    '''
+    cache = cache or get_cache(config)
+    if not (hasattr(models, 'digest') and hasattr(views, 'digest') and hasattr(managers, 'digest')):
+        # o cache depende do hash do código fonte de cada módulo (ver converter.ModuleNodes)
+        cache = None
+    with profiler.stage('mapping_relationships'):
+        relationships = mapping_relationships(models, managers, cache)
+    
+    # a ordem dos módulos define a ordem das violações, tanto na execução serial quanto paralela
+    modules = [(key, 'view', views) for key in views.keys()] + [(key, 'model', models) for key in models.keys()]
+    apps = config.has_key('apps') and config['apps'].split(';')
+    if apps:
+        # todos os modelos são usados nos relacionamentos, mas somente os das apps informadas são verificados
+        modules = [module for module in modules if module[0].split('.')[0] in apps]
+    if only is not None:
+        modules = [module for module in modules if module[0] in only]
+    records = [None] * len(modules)
+    pending = []
+    for index, (key, layer, nodes) in enumerate(modules):
+        # reaproveita as violações se o módulo e os relacionamentos consultados por ele não mudaram
+        # um mesmo módulo pode pertencer às camadas view e model, por isso o registro é separado por camada
+        record = cache and cache.get('{}s'.format(layer), key, nodes.digest(key))
+        if record and is_updated(record['depends'], relationships):
+            records[index] = record
+        else:
+            pending.append(index)
+    
+    # índice do módulo verificado -> índices dos módulos com o mesmo conteúdo e contexto
+    duplicates = {}
+    if pending and hasattr(views, 'sources') and hasattr(models, 'sources'):
+        groups = {}
+        for index in pending:
+            group = content_key(modules[index][0], modules[index][1], modules[index][2], models)
+            duplicates.setdefault(groups.setdefault(group, index), []).append(index)
+        pending = sorted(groups.values())
+    # índice de cada módulo duplicado -> índice do módulo verificado com o mesmo conteúdo
+    by_digest = {}
+    for index, indexes in duplicates.items():
+        for duplicate in indexes[1:]:
+            by_digest[duplicate] = index
+    if summary is not None:
+        summary['duplicates'] = len(by_digest)
+    results = {}
     
+    jobs = get_jobs(config)
+    pool = None
+    if jobs > 1 and len(pending) > 1:
+        # os workers recebem o código fonte e fazem a conversão para AST
+        tasks = (get_task(*modules[index]) for index in pending)
+        pool = multiprocessing.Pool(jobs, init_worker, (relationships, config))
+        checked = pool.imap(check_task, tasks, max(1, len(pending) // (jobs * 4)))
+    else:
+        checked = check_pending(modules, pending, relationships, config)
+    
+    try:
+        for index, (key, layer, nodes) in enumerate(modules):
+            if records[index]:
+                violations = [Violation(key, *violation) for violation in records[index]['violations']]
+                used = records[index]['depends'].keys()
+            else:
+                if by_digest.has_key(index):
+                    # as mesmas violações do módulo com conteúdo idêntico, com o nome deste módulo
+                    violations, used = results[by_digest[index]]
+                    violations = [Violation(key, v.cls, v.method, v.line, v.smell) for v in violations]
+                else:
+                    violations, used = next(checked)
+                    if len(duplicates.get(index, ())) > 1:
+                        results[index] = (violations, used)
+                if cache:
+                    depends = {}
+                    for k in used:
+                        depends[k] = fingerprint(relationships.get(k))
+                    cache.set('{}s'.format(layer), key, nodes.digest(key), {'violations': [[v.cls, v.method, v.line, v.smell] for v in violations],
+                                                                             'depends': depends})
+            if consulted is not None:
+                consulted.setdefault(key, set()).update(used)
+            if layer == 'view' and hasattr(nodes, 'release') and not models.has_key(key) and not managers.has_key(key):
+                nodes.release(key)
+            for violation in violations:
+                if not apps or violation.app in apps:
+                    yield violation
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+def check_pending(modules, pending, relationships, config):
+    for index in pending:
+        key, layer, nodes = modules[index]
+        yield check_layer_module(key, layer, nodes, relationships, config)
+
+# import relativo no início de uma linha (resolvido a partir do pacote do módulo)
+RELATIVE_IMPORT = re.compile(r'^[ \t]*from[ \t]+\.', re.MULTILINE)
+
+def content_key(module, layer, nodes, models):
+    '''
+        Identifica os módulos com as mesmas violações, a menos do nome do módulo: mesmo conteúdo, mesma
+            camada e mesmo contexto. O nome do módulo influencia a verificação pelos imports relativos,
+            que dependem do pacote, e pelas classes do próprio módulo, que são modelos quando ele é um
+            modelo (ou um módulo models, ou do django), então esses módulos não são compartilhados.
+    '''
+    parts = module.split('.')
+    if layer == 'model' or models.has_key(module) or 'models' in parts or parts[0] == 'django':
+        return layer, module
+    package = RELATIVE_IMPORT.search(nodes.sources[module]) and '.'.join(parts[:-1]) or None
+    return layer, nodes.digest(module), package
+
+def get_task(module, layer, nodes):
+    source = hasattr(nodes, 'sources') and nodes.sources[module] or nodes[module]
+    return module, layer, source
+
+def get_jobs(config):
+    '''
+        Número de processos usados na análise. 0 utiliza todos os processadores.
+    '''
+    jobs = int(config.get('jobs', 1) or 1)
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    return jobs
+
+def create_rules(layer, module, relationships, config):
     max_mccabe_complexity = float(config['max_mccabe_complexity'])
     min_mccabe_complexity = float(config['min_mccabe_complexity'])
     max_sql_complexity = float(config['max_sql_complexity'])
     min_sql_complexity = float(config['min_sql_complexity'])
-    relationships = mapping_relationships(models, managers)
-    
+    if layer == 'view':
+        return [MeddlingViewVisitor(module, relationships),
+                BrainPersistenceMethodVisitor(module, max_mccabe_complexity, min_mccabe_complexity, max_sql_complexity, min_sql_complexity),
+                LaboriousPersistenceMethodVisitor(module, relationships)]
+    return [MeddlingModelVisitor(module),
+            ImproperUseOfManagerVisitor(module, relationships),
+            BrainPersistenceMethodVisitor(module, max_mccabe_complexity, min_mccabe_complexity, max_sql_complexity, min_sql_complexity),
+            LaboriousPersistenceMethodVisitor(module, relationships)]
+
+def check_module(module, node, rules, symbols=None):
+    # percorre o AST do módulo uma única vez aplicando todas as regras
+    profile = profiler.current
+    if profile:
+        profile.instrument(rules)
+        start = time.time()
+    CheckerEngine(module, rules, symbols).visit(node)
+    if profile:
+        profile.add_module(module, time.time() - start)
     violations = []
-    
-    for key in views.keys():
-        md = MeddlingViewVisitor(key)
-        md.visit(views[key])
-        violations.extend(md.violations)
-        
-        bpm = BrainPersistenceMethodVisitor(key, max_mccabe_complexity, min_mccabe_complexity, max_sql_complexity, min_sql_complexity)
-        bpm.visit(views[key])
-        violations.extend(bpm.violations)
-        
-        lpm = LaboriousPersistenceMethodVisitor(key, relationships)
-        lpm.visit(views[key])
-        violations.extend(lpm.violations)
-    
-    for key in models.keys():
-        mm = MeddlingModelVisitor(key)
-        mm.visit(models[key])
-        violations.extend(mm.violations)
-        
-        emu = ImproperUseOfManagerVisitor(key, relationships)
-        emu.visit(models[key])
-        violations.extend(emu.violations)
-        
-        bpm = BrainPersistenceMethodVisitor(key, max_mccabe_complexity, min_mccabe_complexity, max_sql_complexity, min_sql_complexity)
-        bpm.visit(models[key])
-        violations.extend(bpm.violations)
-        
-        lpm = LaboriousPersistenceMethodVisitor(key, relationships)
-        lpm.visit(models[key])
-        violations.extend(lpm.violations)
-    
-    result = []    
-    if config.has_key('apps'):
-        for violation in violations:
-            if violation.app in config['apps'].split(';'):
-                result.append(violation)
-    else:
-        result = violations
-    return result
+    for rule in rules:
+        violations.extend(rule.violations)
+    return violations
+
+def check_layer_module(module, layer, nodes, relationships, config):
+    '''
+        Aplica as regras da camada no módulo.
+        Retorna as violações e as chaves dos relacionamentos consultados.
+    '''
+    dependencies = Dependencies(relationships)
+    rules = create_rules(layer, module, dependencies, config)
+    if hasattr(nodes, 'sources'):
+        # descarta pelo código fonte as regras que não podem ser violadas no módulo,
+        # se nenhuma restar o módulo não é convertido em AST
+        rules = [rule for rule in rules if rule.may_violate(nodes.sources[module])]
+    # os imports são resolvidos pelas reexportações do mapa, registradas como as demais dependências
+    violations = rules and check_module(module, nodes[module], rules, SymbolTable(dependencies)) or []
+    return violations, dependencies.used
+
+# estado de cada processo da análise paralela, enviado uma única vez na criação do processo
+worker = {}
+
+def init_worker(relationships, config):
+    worker['relationships'] = relationships
+    worker['config'] = config
+
+def check_task(task):
+    module, layer, source = task
+    nodes = isinstance(source, ast.AST) and {module: source} or ModuleNodes({module: source})
+    return check_layer_module(module, layer, nodes, worker['relationships'], worker['config'])
+
+def is_updated(depends, relationships):
+    for key, value in depends.items():
+        if fingerprint(relationships.get(key)) != value:
+            return False
+    return True
                
-def mapping_relationships(models_node, managers_node):
+def mapping_relationships(models_node, managers_node, cache=None):
+    '''
+        Relacionamentos e managers de cada classe do modelo. O mapa também contém as reexportações dos
+            módulos do modelo e dos managers (symbols.PREFIX + módulo), usadas para resolver os imports,
+            para que as verificações dependam delas como de qualquer relacionamento.
+    '''
+    symbols = mapping_symbols(models_node, managers_node, cache)
     # identifica todos os managers do modelo
-    managers = mapping_managers(managers_node)
-    relationship = {}
+    managers = set(mapping_managers(managers_node, cache))
+    hierarchy = ClassHierarchy(models_node)
+    scanned = {}
     # identifica os atributos da classe que são relacionamentos com outras classes do modelo ou managers
     for key in models_node.keys():
-        scan = ScanModelRelationships(key, managers, models_node)
-        scan.visit(models_node[key])
-        relationship.update(scan.models)
+        scanned.update(scan_relationships(key, managers, models_node, cache, hierarchy, symbols))
+    relationship = index_relationships(scanned)
+    relationship.update(symbols)
     return relationship
 
-def mapping_managers(nodes):
+def short_name(key):
+    '''
+        Nome da classe como referenciado nos relacionamentos (app.Classe).
+    '''
+    parts = key.split('.')
+    return '{}.{}'.format(parts[0], parts[-1])
+
+def index_relationships(scanned):
+    '''
+        Converte os managers e relacionamentos encontrados em cada módulo em Relationship,
+            calculando uma única vez os relacionamentos reversos de cada classe.
+        O índice é refeito a cada execução: é linear no número de classes e mais rápido que lê-lo do cache.
+    '''
+    classes = {}
+    for key in scanned:
+        classes.setdefault(short_name(key), []).append(key)
+    reverse = {}
+    for key, data in scanned.items():
+        for related in data['related']:
+            for target in classes.get(related, ()):
+                reverse.setdefault(target, set()).add(short_name(key))
+    index = {}
+    for key, data in scanned.items():
+        index[key] = Relationship(data['managers'], data['related'], reverse.get(key, ()))
+    return index
+
+def scan_relationships(module, managers, models_node, cache=None, hierarchy=None, symbols=None):
+    symbols = symbols or {}
+    if cache is None:
+        scan = ScanModelRelationships(module, managers, models_node, hierarchy, SymbolTable(symbols))
+        scan.visit(models_node[module])
+        return scan.models
+    # o resultado depende dos managers, das reexportações e dos módulos consultados para resolver a herança das classes
+    digest = models_node.digest(module)
+    managers_digest = fingerprint(sorted(managers))
+    record = cache.get('relationships', module, digest)
+    if record and record['managers'] == managers_digest and is_updated_module(record['bases'], models_node) \
+            and is_updated(record['symbols'], symbols):
+        return record['models']
+    nodes = Dependencies(models_node)
+    exports = Dependencies(symbols)
+    scan = ScanModelRelationships(module, managers, nodes, hierarchy, SymbolTable(exports))
+    scan.visit(models_node[module])
+    bases = {}
+    for key in nodes.used:
+        bases[key] = models_node.has_key(key) and models_node.digest(key) or None
+    used = {}
+    for key in exports.used:
+        used[key] = fingerprint(symbols.get(key))
+    cache.set('relationships', module, digest, {'models': scan.models, 'managers': managers_digest, 'bases': bases,
+                                                'symbols': used})
+    return scan.models
+
+def is_updated_module(bases, nodes):
+    for key, value in bases.items():
+        if (nodes.has_key(key) and nodes.digest(key) or None) != value:
+            return False
+    return True
+
+def mapping_managers(nodes, cache=None):
     managers = []
     # mapeia todos os managers existentes no modelo
     for key in nodes.keys():
-        scan = ScanModelManagers(key)
-        scan.visit(nodes[key])
-        managers.extend(scan.managers)
+        record = cache and cache.get('managers', key, nodes.digest(key))
+        if record:
+            managers.extend(record['managers'])
+        else:
+            scan = ScanModelManagers(key)
+            scan.visit(nodes[key])
+            managers.extend(scan.managers)
+            if cache:
+                cache.set('managers', key, nodes.digest(key), {'managers': scan.managers})
     return managers
 
 
-class Checker(ast.NodeVisitor):
+# Padrões da verificação rápida do código fonte (Checker.may_violate). São mais abrangentes que as
+# regras: uma string que começa com uma palavra de SQLComplexity.DETECT (após aspas, parênteses,
+# espaços ou escapes), uma tag de MeddlingModelVisitor e os identificadores db, raw e execute.
+# As regras verificam as strings do AST, já decodificadas e concatenadas, então um escape que pode
+# representar uma letra ou o "<" (\x3c, \u0073, \N{...}, \074), strings concatenadas implicitamente
+# ('sel' 'ect', inclusive em linhas diferentes) ou uma continuação de linha com "\" fazem as regras de
+# strings serem aplicadas (string_split).
+SQL_LITERAL = re.compile(r'''['"](?:[^a-zA-Z'"\\]|\\.)*(?:and|or|join|select|insert|update|delete|group|order|where|having|from|create|drop|with)''',
+                         re.IGNORECASE | re.DOTALL)
+HTML_TAG = re.compile(r'<[abdfhilps]', re.IGNORECASE)
+DB_NAME = re.compile(r'\bdb\b')
+PERSISTENCE_CALL = re.compile(r'\b(?:raw|execute)\b')
+STRING_ESCAPE = re.compile(r'\\(?:[xuU0-7]|N\{)')
+STRING_JOIN = re.compile(r'''['"](?:[ \t]|(?:#[^\n]*)?\r?\n)+[uUbBrR]{0,2}['"]|[^\s'"(\[{,=:+%*]['"][uUbBrR]{0,2}['"][^\s'")\]},.:%]|\\\r?\n''')
+
+
+def string_split(source):
+    '''
+        Verifica se o valor de alguma string pode não aparecer inteiro no código fonte.
+    '''
+    return bool(STRING_ESCAPE.search(source) or STRING_JOIN.search(source))
+
+
+class ModuleContext():
+    '''
+        Contexto compartilhado pelas regras durante a navegação de um módulo
+        
+        Resolve o símbolo (symbols.Symbol) de cada nome importado ou classe definida uma única vez
+            para todas as regras. Cada regra guarda em imports somente os nomes dos nós que visitou,
+            assim um import dentro de um método ignorado por uma regra não é visto por ela.
+    '''
+    
+    def __init__(self, module, symbols=None):
+        self.module = module
+        self.symbols = symbols or SymbolTable()
+        self.node = None
+        self.names = []
+    
+    def import_names(self, node):
+        '''
+            Retorna a lista de (nome local, símbolo) de um Import ou ImportFrom.
+        '''
+        if node is not self.node:
+            self.names = []
+            for item in node.names:
+                if isinstance(node, ast.ImportFrom):
+                    target = import_target(self.module, node, item)
+                else:
+                    target = item.name
+                self.names.append((item.asname or item.name, self.symbols.symbol(target)))
+            self.node = node
+        return self.names
+    
+    def class_names(self, node):
+        '''
+            Retorna a lista de (nome, símbolo) de uma classe definida no módulo.
+        '''
+        if node is not self.node:
+            self.names = [(node.name, self.symbols.symbol('{}.{}'.format(self.module, node.name)))]
+            self.node = node
+        return self.names
+
+
+class CheckerEngine():
     '''
-        Classe base para navegação no AST
+        Percorre o AST uma única vez despachando cada nó para todas as regras ativas.
+        
+        Cada regra implementa enter_<Nó> e leave_<Nó>. Quando enter_<Nó> retorna False os filhos
+            do nó não são visitados por aquela regra (equivalente a não chamar generic_visit).
     '''
     
-    def __init__(self, module, models=None):
+    def __init__(self, module, rules, symbols=None):
+        self.context = ModuleContext(module, symbols)
+        self.rules = rules
+        for rule in rules:
+            rule.context = self.context
+    
+    def visit(self, node):
+        self.walk(node, self.rules)
+    
+    def walk(self, node, rules):
+        active = [rule for rule in rules if rule.enter(node)]
+        if active:
+            for child in ast.iter_child_nodes(node):
+                self.walk(child, active)
+            for rule in active:
+                rule.leave(node)
+
+
+class Checker():
+    '''
+        Classe base das regras aplicadas na navegação do AST
+    '''
+    
+    def __init__(self, module, models=None, symbols=None):
         self.imports = {}
         self.violations = []
         self.module = module
         self.models = models
+        self.symbols = symbols
         self.cls = None
         self.method = None 
+        self.context = ModuleContext(module, symbols)
+    
+    def visit(self, node):
+        '''
+            Aplica somente esta regra no AST.
+        '''
+        CheckerEngine(self.module, [self], self.symbols).visit(node)
+    
+    def may_violate(self, source):
+        '''
+            Verificação rápida no código fonte do módulo. Retorna False somente se a regra não
+                puder encontrar nenhuma violação, assim a regra não é aplicada no AST.
+        '''
+        return True
         
-    def visit_Module(self, node):
-        self.generic_visit(node)
-        #for violation in self.violations:
-        #    print violation
-            
-    def visit_ImportFrom(self, node):
-        for item in node.names:
-            if node.level == 0:
-                i = '{}.{}'.format(node.module, item.name)
-            else:
-                i = '{}.{}.{}'.format(".".join(self.module.split('.')[:-1]), node.module, item.name)
+    def enter(self, node):
+        method = getattr(self, 'enter_' + node.__class__.__name__, None)
+        if method is None:
+            return True
+        return method(node)
+    
+    def leave(self, node):
+        method = getattr(self, 'leave_' + node.__class__.__name__, None)
+        if method is not None:
+            method(node)
             
-            temp = i.split('.')
-            if '.models.' in i and len(temp) == 4:
-                i = '.'.join([temp[0], temp[1], temp[3]]) 
-            self.imports[item.asname or item.name] = i
+    def enter_ImportFrom(self, node):
+        self.imports.update(self.context.import_names(node))
+        return False
             
-    def visit_Import(self, node):
-        for item in node.names:
-            self.imports[item.asname or item.name] = item.name
+    def enter_Import(self, node):
+        self.imports.update(self.context.import_names(node))
+        return False
     
-    def visit_ClassDef(self, node):
+    def enter_ClassDef(self, node):
         if "Meta" == node.name and self.cls:
-            pass
-        else:
-            self.cls = node.name
-            self.imports[self.cls] = "{}.{}".format(self.module, self.cls)
-            self.pre_visit_ClassDef(node)
-            self.generic_visit(node)
-            self.cls = None
+            return False
+        self.cls = node.name
+        self.imports.update(self.context.class_names(node))
+        self.pre_visit_ClassDef(node)
+        return True
+    
+    def leave_ClassDef(self, node):
+        self.cls = None
             
-    def visit_FunctionDef(self, node):
+    def enter_FunctionDef(self, node):
         if self.method is None:
             self.method = node.name
         else:
             self.method = '{}>{}'.format(self.method, node.name)
         self.pre_visit_FuncitonDef(node)
-        self.generic_visit(node)
+        return True
+    
+    def leave_FunctionDef(self, node):
         self.pos_visit_FuncitonDef(node)
         if '>' in self.method:
             index = self.method.rindex('>')
@@ -147,50 +476,43 @@ class Checker(ast.NodeVisitor):
 
 class MeddlingViewVisitor(Checker):
     
-    def __init__(self, module):
+    def __init__(self, module, relationships=None):
         self.smell = "Meddling View"
-        Checker.__init__(self, module)
+        Checker.__init__(self, module, relationships)
         
-    def visit_ImportFrom(self, node):
+    def may_violate(self, source):
         '''
-            Adiciona na lista de imports as importações do django.db 
+            Um SQL ou um nome importado do django.db (ou de um import relativo dentro do django.db, ou
+                reexportado por um módulo do modelo ou dos managers).
         '''
-        for item in node.names:
-            if node.level == 0:
-                i = '{}.{}'.format(node.module, item.name)
-            else:
-                i = '{}.{}.{}'.format(".".join(self.module.split('.')[:-1]), node.module, item.name)
-            if i.startswith("django.db"):
-                self.imports[item.asname or item.name] = i
-            
-    def visit_Import(self, node):
-        '''
-            Adiciona na lista de imports as importações do django.db 
-        '''
-        for item in node.names:
-            if item.name.startswith("django.db"):
-                self.imports[item.asname or item.name] = item.name
-            
-    def visit_ClassDef(self, node):
+        return bool(SQL_LITERAL.search(source) or string_split(source) or DB_NAME.search(source) or
+                    self.module.startswith('django.db') or SymbolTable(self.models).imports_db(self.module, source))
+        
+    def enter_ClassDef(self, node):
         if self.cls is None:
             self.cls = node.name
-        self.generic_visit(node)
+        return True
+    
+    def leave_ClassDef(self, node):
         if not "Meta" == node.name:
             self.cls = None
     
-    def visit_Str(self, node):
+    def enter_Str(self, node):
         '''
         Verifica se a string é um SQL
         '''
-        if SQLComplexity().is_sql(node.s):
+        if strings.is_sql(node.s):
             self.add_violation(node)
+        return False
             
-    def visit_Name(self, node):
+    def enter_Name(self, node):
         '''
         Verifica se o atributo é um import do django.db 
         '''
-        if self.imports.has_key(node.id):
+        symbol = self.imports.get(node.id)
+        if symbol and symbol.db:
             self.add_violation(node)
+        return False
 
 
 class MeddlingModelVisitor(Checker):
@@ -201,20 +523,17 @@ class MeddlingModelVisitor(Checker):
     def __init__(self, module):
         self.smell = "Meddling Model"
         Checker.__init__(self, module)
-        
+    
+    def may_violate(self, source):
+        return bool(HTML_TAG.search(source) or string_split(source))
             
-    def visit_Str(self, node):
+    def enter_Str(self, node):
         '''
             Verifica se a string contém alguma tag HTML.
         '''
-        tags_html = ["<html", "<head", "<body", "<p", "<span", "<form", "<input", "<link", "<div", "<h", "<d", "<a", '<br']
-        for tag in tags_html:
-            try:
-                if tag in node.s.lower().lstrip():
-                    self.add_violation(node)
-                    break
-            except UnicodeDecodeError:
-                pass
+        if strings.is_html(node.s):
+            self.add_violation(node)
+        return False
             
 
 class ImproperUseOfManagerVisitor(Checker):
@@ -230,23 +549,27 @@ class ImproperUseOfManagerVisitor(Checker):
             Adiciona self e o nome da classe na lista de relacionamentos.
         '''
         self.relationships = {}
-        self.relationships['self'] = self.imports[node.name]
-        self.relationships[node.name] = self.imports[node.name]
+        self.relationships['self'] = self.imports[node.name].target
+        self.relationships[node.name] = self.imports[node.name].target
         
-    def visit_ClassDef(self, node):
+    def enter_ClassDef(self, node):
         classe = '.'.join(self.module.split('.')[0:2] + [node.name])
         if self.models.has_key(classe):
-            Checker.visit_ClassDef(self, node)
+            self.key = classe
+            return Checker.enter_ClassDef(self, node)
+        return False
         
-    def visit_Assign(self, node):
+    def enter_Assign(self, node):
         '''
             Guarda informação que o node faz parte de uma atribuição.
         '''
         self.is_assign = True
-        self.generic_visit(node)
+        return True
+    
+    def leave_Assign(self, node):
         self.is_assign = False
         
-    def visit_Call(self, node):
+    def enter_Call(self, node):
         '''
             Adiciona os relacionamentos com outras classes de modelo na lista de relacionamentos da classe.
             Verifica se a chamada executada é um manager e se esse manager é um dos relacionamentos da classe.
@@ -258,7 +581,7 @@ class ImproperUseOfManagerVisitor(Checker):
                     arg = node.args[0]
                     if isinstance(arg, ast.Name):
                         if self.imports.has_key(arg.id):
-                            self.relationships[arg.id] = self.imports[arg.id]
+                            self.relationships[arg.id] = self.imports[arg.id].target
                             break
                         else:
                             self.relationships[arg.id] = arg.id
@@ -267,7 +590,7 @@ class ImproperUseOfManagerVisitor(Checker):
                         pass
                     else:
                         if 'self' == arg.s:
-                            self.relationships[self.cls] = self.imports[self.cls]
+                            self.relationships[self.cls] = self.imports[self.cls].target
                             break
                         elif len(arg.s.split('.')) == 1:
                             self.relationships[arg.s] = "{}.{}".format(self.module, arg.s)
@@ -285,7 +608,8 @@ class ImproperUseOfManagerVisitor(Checker):
                     and self.is_use_manager(cls, method):
                     self.add_violation(node)
         else:
-            self.generic_visit(node)
+            return True
+        return False
         
     def calcule_Attribute(self, node):
         '''
@@ -317,14 +641,9 @@ class ImproperUseOfManagerVisitor(Checker):
         '''
             Verifica se método executado pelo objeto/atributo é um manager.
         '''
-        if self.imports.has_key(cls):
-            split = self.imports[cls].split('.')
-            key = '{}.{}.{}'.format(split[0], split[1], cls) 
-            if self.models.has_key(key):
-                managers = self.models[key][0]['managers']
-                for manager in managers:
-                    if manager == method:
-                        return True
+        symbol = self.imports.get(cls)
+        if symbol and self.models.has_key(symbol.key):
+            return method in self.models[symbol.key].managers
         return False
     
     def is_relationship(self, cls):
@@ -336,9 +655,8 @@ class ImproperUseOfManagerVisitor(Checker):
             # relacionamento direto
             is_relationship =  True
         elif self.imports.has_key(cls):
-            pk = self.imports[cls]
-            if self.models.has_key(pk) and '{}.{}'.format(self.module.split('.')[0], self.cls) in self.models[pk]:
-                # relacionamento reverso
+            # relacionamento reverso: a classe importada se relaciona com a classe verificada
+            if short_name(self.imports[cls].key) in self.models[self.key].reverse:
                 is_relationship = True
         return is_relationship
     
@@ -346,10 +664,8 @@ class ImproperUseOfManagerVisitor(Checker):
         '''
             Verifica se o objeto/atributo que executa uma chamada é instância de uma classe de modelo. 
         '''
-        if self.imports.has_key(cls):
-            packages = self.imports[cls].split(".")
-            return "models" in packages and not "django" in packages
-        return False    
+        symbol = self.imports.get(cls)
+        return bool(symbol and symbol.in_models)    
    
    
 class BrainPersistenceMethodVisitor(Checker):
@@ -362,18 +678,25 @@ class BrainPersistenceMethodVisitor(Checker):
         self.max_sql = max_sql
         Checker.__init__(self, module)
     
-    def visit_FunctionDef(self, node):
+    def may_violate(self, source):
+        '''
+            Sem SQL a complexidade do SQL é -1.
+        '''
+        return min(self.min_sql, self.max_sql) <= -1 or bool(SQL_LITERAL.search(source) or string_split(source))
+    
+    def enter_FunctionDef(self, node):
         '''
             Avalia a complexidade código e do SQL no método. 
         '''
         self.method = node.name
-        code = McCabeComplexity().calcule(node)
+        code = complexities.calcule_mccabe(self.module, node)
         if code >= self.min_code:
-            sql = SQLComplexity().calcule(node)
+            sql = complexities.calcule_sql(self.module, node)
             if (sql >= self.max_sql and code >= self.min_code) or (sql >= self.min_sql and 
                                                                    code >= self.max_code):
                 self.add_violation(node)
         self.method = None
+        return False
 
 
 class LaboriousPersistenceMethodVisitor(Checker):
@@ -386,6 +709,12 @@ class LaboriousPersistenceMethodVisitor(Checker):
         self.cursor = None
         Checker.__init__(self, module, models)
     
+    def may_violate(self, source):
+        '''
+            Só são contadas as chamadas cursor.execute() e manager.raw().
+        '''
+        return bool(PERSISTENCE_CALL.search(source))
+    
     def pre_visit_FuncitonDef(self, _):
         '''
             reinicia variáveis antes de analisar nova função.
@@ -403,14 +732,16 @@ class LaboriousPersistenceMethodVisitor(Checker):
         self.count = 0
         self.querys = []
         
-    def visit_Assign(self, node):
+    def enter_Assign(self, node):
         self.is_assign = True
-        self.generic_visit(node)
+        return True
+    
+    def leave_Assign(self, node):
         if self.cursor == True:
             self.cursor = node.targets[0].id
         self.is_assign = False
     
-    def visit_Call(self, node):
+    def enter_Call(self, node):
         '''
             Verifica chamadas executadas dentro de métodos.
             Verifica se chamada é executada pelo método raw (manager) ou  execute (django.db)
@@ -425,20 +756,16 @@ class LaboriousPersistenceMethodVisitor(Checker):
                 if cls and method and (self.is_api_persistence(cls, method) or 
                                        self.is_manager_raw(cls, method, method_2)):
                     self.count+=1
-        else:
-            self.generic_visit(node)
+            return False
+        return True
     
     def is_manager_raw(self, cls, method, method_2):
         '''
             Verifica se chamada executada é manager.raw()
         '''
-        if 'raw' == method_2 and self.imports.has_key(cls):
-            split = self.imports[cls].split('.')
-            key = '{}.{}.{}'.format(split[0], split[1], cls) 
-            if self.models.has_key(key):
-                managers = self.models[key][0]['managers']
-                for manager in managers:
-                    return manager == method
+        symbol = 'raw' == method_2 and self.imports.get(cls)
+        if symbol and self.models.has_key(symbol.key):
+            return method in self.models[symbol.key].managers
         return False
     
     def is_api_persistence(self, cls, method):
@@ -447,13 +774,17 @@ class LaboriousPersistenceMethodVisitor(Checker):
         '''
         if self.is_assign:
             if self.imports.has_key(cls):
-                package = self.imports[cls]
+                package = self.imports[cls].target
                 if 'django.db.connection' == package and 'cursor' == method:
                     self.cursor = True
                     return False
         elif self.cursor and self.cursor == cls and 'execute' == method: return True
         else: return False    
     
+    def enter_Attribute(self, node):
+        # o nome do atributo é resolvido por visit_Attribute, sem navegar nos filhos
+        return False
+    
     def visit_Attribute(self, node):
         '''
             Identifica nome do objeto que executa chamada.
@@ -474,12 +805,13 @@ class LaboriousPersistenceMethodVisitor(Checker):
 
 class ScanModelRelationships(Checker):
         
-    def __init__(self, module, managers, models_node):
+    def __init__(self, module, managers, models_node, hierarchy=None, symbols=None):
         self.managers = managers
         self.is_assign = False
         self.obj_manager = None
         self.models_node = models_node
-        Checker.__init__(self, module, {})
+        self.hierarchy = hierarchy or ClassHierarchy(models_node)
+        Checker.__init__(self, module, {}, symbols)
         
     def pre_visit_ClassDef(self, node):
         # verifica se classe é do tipo Model
@@ -495,11 +827,9 @@ class ScanModelRelationships(Checker):
                 break
             else:
                 if self.imports.has_key(classe_heranca):
-                    key_module = '.'.join(self.imports[classe_heranca].split('.')[:-1])
+                    key_module = self.imports[classe_heranca].module
                     if self.models_node.has_key(key_module):
-                        scan = ScanModelBases(classe_heranca, self.models_node[key_module])
-                        scan.visit(self.models_node[key_module])
-                        is_model = scan.is_model
+                        is_model = self.hierarchy.is_model(key_module, classe_heranca)
                         if is_model:
                             break
                                      
@@ -511,25 +841,28 @@ class ScanModelRelationships(Checker):
                 module = '.'.join([temp[0], temp[1]]) 
             self.key = '{}.{}'.format(module, node.name)
             # adiciona na lista de managers o manager padrão
-            self.models[self.key] = [{'managers':['objects']}]
+            self.models[self.key] = {'managers': ['objects'], 'related': []}
         
-    def visit_Assign(self, node):
+    def enter_Assign(self, node):
         if hasattr(self, "key"):
             self.is_assign = True
-            self.generic_visit(node)
-            # adiciona atributo na lista de managers se ele for do tipo Manager
-            if self.obj_manager:
-                name_manager = node.targets[0].id
-                self.models[self.key][0]['managers'].append(name_manager)
-            self.obj_manager = None
-            self.is_assign = False
+            return True
+        return False
+    
+    def leave_Assign(self, node):
+        # adiciona atributo na lista de managers se ele for do tipo Manager
+        if self.obj_manager:
+            name_manager = node.targets[0].id
+            self.models[self.key]['managers'].append(name_manager)
+        self.obj_manager = None
+        self.is_assign = False
         
-    def visit_Call(self, node):
+    def enter_Call(self, node):
         if hasattr(self, "key") and self.is_attribute_class():
             name = self.visit_Attribute(node.func)
             # identifica se atributo é do tipo Manager
-            if self.imports.has_key(name) and self.imports[name] in self.managers:
-                self.obj_manager = self.imports[name]
+            if self.imports.has_key(name) and self.imports[name].target in self.managers:
+                self.obj_manager = self.imports[name].target
             else:
                 # adiciona o tipo do modelo se o atributo for relacionamento com outro modelo
                 for value in ['models.ForeignKey', 'models.OneToOneField', 'models.ManyToManyField']:
@@ -537,12 +870,12 @@ class ScanModelRelationships(Checker):
                         arg = node.args[0]
                         if isinstance(arg, ast.Name):
                             if self.imports.has_key(arg.id):
-                                cls = '{}.{}'.format(self.imports[arg.id].split('.')[0], arg.id)
-                                self.models[self.key].append(cls)
+                                cls = '{}.{}'.format(self.imports[arg.id].app, arg.id)
+                                self.models[self.key]['related'].append(cls)
                                 break
                             else:
                                 cls = '{}.{}'.format(self.module.split('.')[0], arg.id)
-                                self.models[self.key].append(cls)
+                                self.models[self.key]['related'].append(cls)
                                 break
                         elif isinstance(arg, ast.Attribute):
                             pass
@@ -551,13 +884,17 @@ class ScanModelRelationships(Checker):
                                 break
                             elif len(arg.s.split('.')) == 1:
                                 cls = "{}.{}".format(self.module.split('.')[0], arg.s)
-                                self.models[self.key].append(cls)
+                                self.models[self.key]['related'].append(cls)
                                 break
                             else:
-                                self.models[self.key].append(arg.s)
+                                self.models[self.key]['related'].append(arg.s)
                                 break
-        else:
-            self.generic_visit(node)
+            return False
+        return True
+    
+    def enter_Attribute(self, node):
+        # o tipo do atributo é resolvido por visit_Attribute, sem navegar nos filhos
+        return False
     
     def visit_Attribute(self, node):
         # identifica o tipo do atributo
@@ -579,28 +916,102 @@ class ScanModelRelationships(Checker):
         return self.is_assign and self.cls and not self.method
 
 
+class Relationship(object):
+    '''
+        Managers, relacionamentos (app.Classe) e relacionamentos reversos (classes que se relacionam
+            com esta) de uma classe do modelo, em conjuntos para que cada consulta das regras seja direta.
+
+        serialize retorna os valores em json (ordenados), usado no hash das dependências do cache e
+            no envio aos processos da análise paralela.
+    '''
+    __slots__ = ('managers', 'related', 'reverse')
+
+    def __init__(self, managers=(), related=(), reverse=()):
+        self.managers = frozenset(managers)
+        self.related = frozenset(related)
+        self.reverse = frozenset(reverse)
+
+    def serialize(self):
+        return {'managers': sorted(self.managers), 'related': sorted(self.related), 'reverse': sorted(self.reverse)}
+
+    def __getstate__(self):
+        return self.serialize()
+
+    def __setstate__(self, state):
+        self.managers = frozenset(state['managers'])
+        self.related = frozenset(state['related'])
+        self.reverse = frozenset(state['reverse'])
+
+    def __eq__(self, other):
+        return isinstance(other, Relationship) and (self.managers, self.related, self.reverse) == \
+            (other.managers, other.related, other.reverse)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Relationship({})'.format(self.serialize())
+
+
+class ClassHierarchy():
+    '''
+        Índice das heranças das classes de cada módulo do modelo (módulo -> classe -> bases).
+        
+        Cada módulo é percorrido uma única vez, no primeiro acesso, e a verificação se uma classe
+            herda de Model é memorizada.
+    '''
+    
+    def __init__(self, models_node):
+        self.models_node = models_node
+        self.classes = {}
+        self.models = {}
+    
+    def bases(self, module):
+        if not self.classes.has_key(module):
+            scan = ScanModelBases()
+            scan.visit(self.models_node[module])
+            self.classes[module] = scan.classes
+        return self.classes[module]
+    
+    def is_model(self, module, name):
+        '''
+            Verifica se a classe herda de uma classe Model, considerando as heranças definidas no próprio módulo.
+        '''
+        key = (module, name)
+        if not self.models.has_key(key):
+            # evita recursão infinita em heranças cíclicas
+            self.models[key] = False
+            is_model = False
+            # se houver mais de uma definição da classe no módulo prevalece a última
+            for bases in self.bases(module).get(name, []):
+                for base in bases:
+                    if base and 'Model' in base:
+                        is_model = True
+                        break
+                    elif base:
+                        is_model = self.is_model(module, base)
+            self.models[key] = is_model
+        return self.models[key]
+
+
 class ScanModelBases(ast.NodeVisitor):
     
-    def __init__(self, classe_base, node_original):
-        self.classe_base = classe_base
-        self.node_original = node_original
-        self.is_model = False
+    def __init__(self):
+        self.classes = {}
     
     def visit_ClassDef(self, node):
-        if self.classe_base == node.name:
-            for base in node.bases:
-                classe = None
-                if isinstance(base, ast.Name):
-                    classe = base.id
-                elif isinstance(base, ast.Attribute):
-                    classe = base.attr
-                if 'Model' in classe:
-                    self.is_model = True
-                    break
-                else:
-                    scan = ScanModelBases(classe, self.node_original)
-                    scan.visit(self.node_original)
-                    self.is_model = scan.is_model
+        # registra o nome das classes herdadas
+        bases = []
+        for base in node.bases:
+            classe = None
+            if isinstance(base, ast.Name):
+                classe = base.id
+            elif isinstance(base, ast.Attribute):
+                classe = base.attr
+            bases.append(classe)
+        self.classes.setdefault(node.name, []).append(bases)
     
 
 class ScanModelManagers(ast.NodeVisitor):
@@ -666,24 +1077,139 @@ class SQLComplexity(ast.NodeVisitor):
         return HalsteadComplexity(self.OPERATORS, self.IGNORE).calcule_difficulty(source)        
                 
     def is_sql(self, source):
-        try:
-            for statement in self.DETECT:
-                source = source.lstrip('(')
-                if source.lower().lstrip().startswith(statement):
-                    return True
-        except UnicodeDecodeError:
-            pass
-        return False
+        return strings.is_sql(source)
+
+
+class StringClassifier():
+    '''
+        Classifica cada string do código como SQL e/ou HTML com expressões regulares pré-compiladas,
+            compartilhadas por MeddlingViewVisitor, MeddlingModelVisitor e SQLComplexity.
+        
+        O resultado é memorizado por string, pois a mesma string é verificada por várias regras.
+    '''
+    SQL = 1
+    HTML = 2
+    
+    # https://www.w3schools.com/tags/ref_byfunc.asp
+    TAGS = ('<html', '<head', '<body', '<p', '<span', '<form', '<input', '<link', '<div', '<h', '<d', '<a', '<br')
+    
+    # parênteses e espaços no início da string seguidos de uma palavra de SQLComplexity.DETECT
+    SQL_PATTERN = re.compile(r'\(*\s*(?:{})'.format('|'.join(re.escape(statement) for statement in SQLComplexity.DETECT)), re.UNICODE)
+    HTML_PATTERN = re.compile('|'.join(re.escape(tag) for tag in TAGS))
+    
+    def __init__(self, size=10000):
+        self.size = size
+        self.clear()
+    
+    def clear(self):
+        # str e unicode com o mesmo conteúdo podem ter classificações diferentes
+        self.results = {str: {}, unicode: {}}
+    
+    def classify(self, value):
+        results = self.results[value.__class__]
+        if not results.has_key(value):
+            if len(results) >= self.size:
+                # limita a memória usada em projetos grandes
+                results.clear()
+            results[value] = self.calcule(value)
+        return results[value]
+    
+    def calcule(self, value):
+        if isinstance(value, str):
+            try:
+                value = value.decode('ascii')
+            except UnicodeDecodeError:
+                # strings com bytes não ascii nunca foram consideradas SQL ou HTML
+                return 0
+        value = value.lower()
+        result = 0
+        if self.SQL_PATTERN.match(value):
+            result |= self.SQL
+        if self.HTML_PATTERN.search(value):
+            result |= self.HTML
+        return result
+    
+    def is_sql(self, value):
+        return bool(self.classify(value) & self.SQL)
+    
+    def is_html(self, value):
+        return bool(self.classify(value) & self.HTML)
+
+strings = StringClassifier()
+
+
+class FunctionComplexity():
+    '''
+        Complexidade de McCabe e do SQL de cada função, calculada uma única vez na execução e
+            compartilhada entre benchmarking.Metrics e BrainPersistenceMethodVisitor.
+        
+        A chave é o módulo, o nome e a posição da função, pois cada um converte o módulo em AST separadamente.
+        As complexidades calculadas nos processos da análise paralela são adicionadas com update, e
+            os processos do checker, criados depois, as recebem do processo principal.
+    '''
+    
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        self.mccabe = {}
+        self.sql = {}
+    
+    def update(self, mccabe, sql):
+        self.mccabe.update(mccabe)
+        self.sql.update(sql)
+    
+    def key(self, module, node):
+        return (module, node.name, node.lineno, node.col_offset)
+    
+    def calcule_mccabe(self, module, node):
+        key = self.key(module, node)
+        if key not in self.mccabe:
+            self.mccabe[key] = McCabeComplexity().calcule(node)
+        return self.mccabe[key]
+    
+    def calcule_sql(self, module, node):
+        key = self.key(module, node)
+        if key not in self.sql:
+            self.sql[key] = SQLComplexity().calcule(node)
+        return self.sql[key]
+
+complexities = FunctionComplexity()
 
 
-class Violation():
+# nomes de app, módulo, classe, método e smell compartilhados entre as violações
+names = {}
+
+def shared(value):
+    if value is None:
+        return None
+    return names.setdefault(value, value)
+
+class Violation(object):
+    '''
+        Violação encontrada por uma regra.
+        
+        Usa __slots__ e compartilha as strings repetidas (intern não aceita unicode no python 2), pois
+            projetos legados podem ter centenas de milhares de violações.
+    '''
+    __slots__ = ('key', 'app', 'module', 'cls', 'method', 'line', 'smell')
+    
     def __init__(self, module, cls, method, line, smell):
-        self.app = module.split('.')[0]
-        self.module = module.split('.')[1]
-        self.cls = cls
-        self.method = method
+        # nome completo do módulo, app e module são o primeiro e o segundo nível
+        self.key = shared(module)
+        parts = module.split('.')
+        self.app = shared(parts[0])
+        self.module = shared(parts[1])
+        self.cls = shared(cls)
+        self.method = shared(method)
         self.line = line
-        self.smell = smell
+        self.smell = shared(smell)
+    
+    def fields(self):
+        '''
+            Colunas do relatório design_problems_details.csv.
+        '''
+        return [self.smell, self.app, self.module, self.cls or '-', self.method or '-', self.line, '']
         
     def __str__(self):
         return '{};{};{};{};{};{};'.format(self.smell, self.app, self.module, self.cls or '-', self.method or '-', self.line)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-from mccabe import PathGraphingAstVisitor
+import re
 
 
 class McCabeComplexity():
@@ -10,6 +10,8 @@ class McCabeComplexity():
             Recebe um nó de uma função como entrada e utiliza PathGraphingAstVisitor para calcular 
                 a complexidade de mccabe
         '''
+        # importado na primeira medição, somente as análises que calculam a complexidade carregam o mccabe
+        from mccabe import PathGraphingAstVisitor
         mccabe_visitor = PathGraphingAstVisitor()
         mccabe_visitor.preorder(node, mccabe_visitor)
         return mccabe_visitor.graphs.values()[0].complexity()
@@ -17,9 +19,12 @@ class McCabeComplexity():
 
 class HalsteadComplexity():
     
+    # espaço, vírgula, parênteses e quebra de linha separam os tokens
+    TOKEN = re.compile(r'[^ ,()\n]+')
+    
     def __init__(self, operators=(), ignore=()):
-        self.operators = operators
-        self.ignore = ignore
+        self.operators = frozenset(operators)
+        self.ignore = frozenset(ignore)
     
     def count_n(self, source):
         n1, n2, N1, N2 = self.calcule_n(source)
@@ -36,29 +41,18 @@ class HalsteadComplexity():
         n2 = []
         N1 = []
         N2 = []
-        position = 0
-        source = source.replace('\n', ' ')
-        source = source.lower()
-        while position < len(source):
-            var = ''
-            while source[position] not in (' ', ',', '(', ')'):
-                var = var + source[position]
-                position += 1
-                if position + 1 > len(source):
-                    break
-                
-            if var != '':
-                if var in self.operators:
-                    N1.append(var)
-                    if var not in n1:
-                        n1.append(var)
-                elif var not in self.ignore:
-                    N2.append(var)
-                    if var not in n2:
-                        n2.append(var)
-            position += 1
-            if position + 1 > len(source):
-                break
+        distinct = set()
+        for var in self.TOKEN.findall(source.lower()):
+            if var in self.operators:
+                N1.append(var)
+                if var not in distinct:
+                    distinct.add(var)
+                    n1.append(var)
+            elif var not in self.ignore:
+                N2.append(var)
+                if var not in distinct:
+                    distinct.add(var)
+                    n2.append(var)
         return n1, n2, N1, N2
     
     def calcule_difficulty(self, source):
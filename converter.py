@@ -2,17 +2,118 @@
 from __future__ import unicode_literals
 
 import ast
+import hashlib
+import profiler
 
 class SourceToAST():
+    '''
+        Converte os arquivos python do projeto em AST.
+        
+        Cada arquivo é lido e convertido uma única vez por execução, e o resultado é compartilhado
+            entre os subcomandos (metrics, loc e checker). Arquivos com o mesmo conteúdo compartilham o AST.
+    '''
      
     def __init__(self, config):
         self.project = config['project']
+        self.sources = {}
+        self.nodes = {}
+        self.digests = {}
+        self.contents = {}
+
+    def module_name(self, fname):
+        return fname.replace(self.project, '').strip('.').replace('/', '.')[1:-3]
+    
+    def source(self, fname):
+        if not self.sources.has_key(fname):
+            self.sources[fname] = open(fname.__str__()).read()
+        return self.sources[fname]
+
+    def reload(self, fname):
+        '''
+            Descarta o código fonte, o AST e o hash de um arquivo alterado, que será lido no próximo acesso.
+            Retorna o nome do módulo.
+        '''
+        module = self.module_name(fname)
+        self.sources.pop(fname, None)
+        self.nodes.pop(module, None)
+        self.digests.pop(module, None)
+        return module
 
     def parse(self, files):
         nodes = {}
         # converte cada arquivo python em um node do AST
+        loaded = self.load(files)
+        for fname in files:
+            module = self.module_name(fname)
+            nodes[module] = loaded[module]
+        return nodes
+    
+    def load(self, files):
+        # lê os arquivos python, a conversão para AST é feita no primeiro acesso
+        sources = {}
         for fname in files:
-            module = fname.replace(self.project, '').strip('.').replace('/', '.')[1:-3]
-            node = ast.parse(open(fname.__str__()).read())
-            nodes[module] = node
-        return nodes
\ No newline at end of file
+            sources[self.module_name(fname)] = self.source(fname)
+        return ModuleNodes(sources, self.nodes, self.digests, self.contents)
+    
+    def load_layers(self, layers):
+        '''
+            Módulos de cada camada. Um arquivo que pertence a mais de uma camada é lido e convertido uma única vez.
+        '''
+        result = {}
+        for layer, files in layers.items():
+            result[layer] = self.load(files)
+        return result
+
+
+class ModuleNodes():
+    '''
+        Módulos do projeto indexados pelo nome, com conversão para AST sob demanda.
+        
+        Permite que módulos cujo resultado está em cache não sejam convertidos. Um módulo com o mesmo
+            conteúdo de outro já convertido recebe o mesmo AST (as regras não alteram o AST).
+    '''
+    
+    def __init__(self, sources, nodes=None, digests=None, contents=None):
+        self.sources = sources
+        self.nodes = {} if nodes is None else nodes
+        self.digests = {} if digests is None else digests
+        # hash do conteúdo -> último módulo convertido com esse conteúdo
+        self.contents = {} if contents is None else contents
+    
+    def keys(self):
+        return self.sources.keys()
+    
+    def has_key(self, module):
+        return self.sources.has_key(module)
+    
+    def __contains__(self, module):
+        return self.sources.has_key(module)
+    
+    def __len__(self):
+        return len(self.sources)
+    
+    def __getitem__(self, module):
+        if not self.nodes.has_key(module):
+            shared = self.contents.get(self.digest(module))
+            # o módulo pode ter sido alterado depois da conversão (SourceToAST.reload)
+            if shared and self.nodes.has_key(shared) and self.digests.get(shared) == self.digest(module):
+                self.nodes[module] = self.nodes[shared]
+            else:
+                with profiler.stage('SourceToAST.parse', memory=False):
+                    self.nodes[module] = ast.parse(self.sources[module])
+                self.contents[self.digest(module)] = module
+        return self.nodes[module]
+    
+    def release(self, module):
+        '''
+            Descarta o AST do módulo, que é convertido novamente se for acessado outra vez.
+        '''
+        self.nodes.pop(module, None)
+    
+    def digest(self, module):
+        '''
+            Hash do conteúdo do módulo.
+        '''
+        if not self.digests.has_key(module):
+            self.digests[module] = hashlib.sha1(self.sources[module]).hexdigest()
+        return self.digests[module]
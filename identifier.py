@@ -5,20 +5,57 @@ import os
 import fnmatch
 
 
-def get_files(project, extension='py'):
+# diretórios que não fazem parte do código fonte da aplicação
+EXCLUDE = ('.git', '.hg', '.svn', '.tox', '.venv', 'venv', 'virtualenv', 'site-packages', 'node_modules',
+           'migrations', 'static', '__pycache__', '.mtvcache')
+
+
+def get_files(project, extension='py', exclude=()):
         files = []
         if os.path.isdir(project):
-            for root, _, filenames in os.walk(project):
+            for root, dirs, filenames in os.walk(project):
+                # remove os diretórios ignorados antes que o os.walk entre neles
+                dirs[:] = [d for d in dirs if not is_excluded(os.path.join(root, d), project, exclude)]
                 for filename in fnmatch.filter(filenames, '*.{}'.format(extension)):
-                    files.append(os.path.join(root, filename))
+                    path = os.path.join(root, filename)
+                    if not is_excluded(path, project, exclude):
+                        files.append(path)
         return files
 
 
+def is_excluded(path, project, exclude):
+    '''
+        Verifica se o nome ou o caminho relativo ao projeto corresponde a algum dos padrões (glob) ignorados.
+    '''
+    if exclude:
+        name = os.path.basename(path)
+        relative = os.path.relpath(path, project)
+        for pattern in exclude:
+            if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern):
+                return True
+    return False
+
+
+def get_exclude(config):
+    if config.has_key('exclude'):
+        return [pattern for pattern in config['exclude'].split(';') if pattern]
+    return EXCLUDE
+
+
+# camadas identificadas pelo nome do diretório ou do arquivo
+LAYERS = ('models', 'views', 'admin', 'forms', 'managers')
+
+
+def get_app(project, filename):
+    return os.path.relpath(filename, project).split(os.sep)[0]
+
+
 class Identifier():
     
     def __init__(self, config):
         self.config = config
-        self.files = get_files(self.config['project'])
+        self.files = get_files(self.config['project'], exclude=get_exclude(config))
+        self.layers = self.classify(self.files)
         
     def all(self):
         return {'view':self.get_view(), 'model':self.get_model(), 'manager':self.get_managers()} 
@@ -31,27 +68,51 @@ class Identifier():
         result.extend(self.get_files_by_layer('views'))
         result.extend(self.get_files_by_layer('admin'))
         result.extend(self.get_files_by_layer('forms'))
-        return result
+        # os modelos e managers de todas as apps são mantidos para identificar os relacionamentos
+        return self.filter_apps(result)
+    
+    def filter_apps(self, files):
+        '''
+            Mantém somente os arquivos das apps informadas no arquivo de configuração.
+        '''
+        if not self.config.has_key('apps'):
+            return files
+        apps = self.config['apps'].split(';')
+        return [filename for filename in files if get_app(self.config['project'], filename) in apps]
     
     def get_managers(self):
         return self.get_files_by_layer('managers')
         
     def get_files_by_layer(self, layer):
-        layer_files = []
-        layers = [layer]
-        # adiciona outros diretórios da camada fora do padrão
-        if self.config.has_key(layer):
-            lista = self.config[layer]
-            if ';' in lista: 
-                for l in list.split(';'):
-                    layers.append(l)
-            else:
-                layers.append(lista)
-            
-        # identifica os arquivos python da camada
-        for filedir in self.files:
+        return [filedir for filedir in self.files if layer in self.layers.get(filedir, ())]
+    
+    def get_layer_names(self):
+        '''
+            Nomes de diretório ou arquivo (sem .py) que identificam cada camada.
+        '''
+        names = {}
+        for layer in LAYERS:
+            values = [layer]
+            # adiciona outros diretórios da camada fora do padrão
+            if self.config.has_key(layer):
+                values.extend(self.config[layer].split(';'))
+            for name in values:
+                if name and layer not in names.setdefault(name, []):
+                    names[name].append(layer)
+        return names
+    
+    def classify(self, files):
+        '''
+            Identifica em uma única passada as camadas de cada arquivo python (caminho -> camadas).
+        '''
+        names = self.get_layer_names()
+        layers = {}
+        for filedir in files:
             f = filedir.split('/')
-            for layer in layers:
-                if f[-2] == layer or f[-1] == '{}.py'.format(layer):
-                    layer_files.append(filedir)
-        return layer_files
+            found = []
+            for layer in names.get(f[-2], []) + names.get(f[-1][:-3], []):
+                if layer not in found:
+                    found.append(layer)
+            if found:
+                layers[filedir] = found
+        return layers
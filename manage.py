@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-from benchmarking import get_LOC, get_metrics
+from benchmarking import LINES, get_LOC, get_metrics
+import os
 import sys
-from report import print_metrics, exportar_csv, export_csv
-from identifier import Identifier, get_files
+import cProfile
+import profiler
+from report import metrics_table, summarize_metrics, print_metrics, export_summary, exportar_csv, export_csv
+from identifier import Identifier
 from converter import SourceToAST
-from checker import checker
+from checker import iter_violations, complexities
+from watcher import watch
+from scope import DiffScope
+from baseline import load_baseline, save_baseline, compare_baseline
+from store import ResultStore
 
 
 def get_config():
@@ -19,64 +26,208 @@ def get_config():
     return config
 
 
-def start_analysis(config):
+# opções que não recebem valor (--profile ou --profile=arquivo)
+FLAGS = ('profile', 'update_baseline')
+
+
+def get_options(argv, config, flags=()):
+    '''
+        Opções no formato --nome valor sobrescrevem o arquivo de configuração.
+        Retorna os demais argumentos.
+    '''
+    args = []
+    position = 1
+    while position < len(argv):
+        arg = argv[position]
+        if arg.startswith('--') and '=' in arg:
+            key, value = arg[2:].split('=', 1)
+            config[key] = value
+        elif arg.startswith('--') and arg[2:] in flags:
+            config[arg[2:]] = ''
+        elif arg.startswith('--') and position + 1 < len(argv):
+            config[arg[2:]] = argv[position + 1]
+            position += 1
+        else:
+            args.append(arg)
+        position += 1
+    return args
+
+
+def start_analysis(config, identifier=None, converter=None, store=None):
     print(' - Identificando camadas')
-    layers = Identifier(config).all()
+    layers = (identifier or Identifier(config)).all()
     print(' - Convertendo arquivos para AST')
-    converter = SourceToAST(config)
-    models = converter.parse(layers['model'])
-    views = converter.parse(layers['view'])
-    managers = converter.parse(layers['manager'])
+    converter = converter or SourceToAST(config)
+    with profiler.stage('SourceToAST.load'):
+        nodes = converter.load_layers(layers)
+    models = nodes['model']
+    views = nodes['view']
+    managers = nodes['manager']
     
+    scope = None
+    if config.get('diff'):
+        # somente os módulos alterados no intervalo de revisões e os que dependem deles
+        scope = DiffScope(config, layers, nodes, converter)
+        print(' - {} módulos alterados, {} dependentes'.format(len(scope.ranges), len(scope.dependents)))
     print(' - Analisando código fonte')
-    violations = checker(models, views, managers, config)
+    summary = {}
+    violations = iter_violations(models, views, managers, config, only=scope and scope.modules,
+                                 consulted=scope and scope.consulted, summary=summary)
+    if scope:
+        violations = scope.filter(violations)
+    if store:
+        violations = store.add_violations(violations)
     print(' - Gerando relatórios')
-    export_csv(['design problem', 'app', 'module', 'class', 'function', 'line'], violations, 'design_problems_details.csv')
-    d = {}
-    for v in violations:
-        key = '{};{};{};{}'.format(v.app, v.module, v.cls or '_', v.method or '_')
-        if not d.has_key(key):
-            d[key] = {'Meddling View':'', 'Meddling Model':'', 'Improper Use of Manager':'', 'Brain Persistence Method':'', 'Laborious Persistence Method':''}
-        d[key][v.smell] = 'yes' 
-    result = []
-    for k, value in d.items():
-        s = '{};{};{};{};{};{}'.format(k, value['Meddling View'],value['Meddling Model'],value['Improper Use of Manager'],value['Brain Persistence Method'],value['Laborious Persistence Method'])
-        result.append(s)
-    export_csv(['app', 'module', 'class', 'function', 'Meddling View', 'Meddling Model', 'Improper Use of Manager', 'Brain Persistence Method', 'Laborious Persistence Method'], result, 'design_problems.csv')
+    # as violações são verificadas à medida que os relatórios são gravados
+    with profiler.stage('checker'):
+        baseline = config.get('baseline')
+        if baseline and os.path.exists(baseline) and not config.has_key('update_baseline'):
+            added = export_baseline_diff(violations, baseline)
+        else:
+            if baseline:
+                violations = save_baseline(violations, baseline)
+            export_reports(violations)
+            added = 0
+    if summary.get('duplicates'):
+        print(' - {} módulos com conteúdo idêntico a outro verificados uma única vez'.format(summary['duplicates']))
+    return added
+
+
+SMELLS = ('Meddling View', 'Meddling Model', 'Improper Use of Manager', 'Brain Persistence Method', 'Laborious Persistence Method')
+
+
+def export_reports(violations):
+    summary = {}
+    
+    def details(violations):
+        # monta o resumo por app, módulo, classe e função enquanto grava o detalhamento
+        for v in violations:
+            key = '{};{};{};{}'.format(v.app, v.module, v.cls or '_', v.method or '_')
+            if not summary.has_key(key):
+                summary[key] = [v.app, v.module, v.cls or '_', v.method or '_'] + [''] * len(SMELLS)
+            summary[key][4 + SMELLS.index(v.smell)] = 'yes'
+            yield v
+    
+    export_csv(['design problem', 'app', 'module', 'class', 'function', 'line'], details(violations), 'design_problems_details.csv')
+    export_csv(['app', 'module', 'class', 'function'] + list(SMELLS), summary.values(), 'design_problems.csv')
+
+
+def export_baseline_diff(violations, baseline):
+    '''
+        Grava somente as violações novas e as resolvidas em relação à baseline.
+        Retorna o número de violações novas.
+    '''
+    added, resolved = compare_baseline(violations, load_baseline(baseline))
+    for violation in added:
+        print('   + {}'.format(violation))
+    rows = [['new'] + violation.fields()[:-1] for violation in added] + [['resolved'] + fields + [''] for fields in resolved]
+    export_csv(['status', 'design problem', 'app', 'module', 'class', 'function', 'line'], rows, 'design_problems_baseline.csv')
+    print(' - {} novas, {} resolvidas em relação à baseline {}'.format(len(added), len(resolved), baseline))
+    return len(added)
+
+
+def run(args, config):
+    '''
+        Retorna o número de violações novas em relação à baseline.
+    '''
+    added = 0
+    # as complexidades calculadas pelo metrics são reaproveitadas pelo checker somente nesta execução
+    complexities.clear()
+    if 'trends' in args and not config.get('store'):
+        # o histórico só existe no banco de dados informado
+        print('### Informe o banco de dados do histórico com --store arquivo.db ou store: no arquivo de configuração.')
+        sys.exit(1)
+    with profiler.stage('get_files'):
+        identifier = Identifier(config)
+    # cada arquivo é lido e convertido uma única vez para todos os subcomandos
+    converter = SourceToAST(config)
+    # histórico dos resultados, opcional
+    store = config.get('store') and ResultStore(config['store'], config['project'])
+    if len(args) > 0:
+        if 'metrics' in args:
+            calculated = {}
+            with profiler.stage('metrics'):
+                table = metrics_table(get_metrics(config, identifier, converter, calculated))
+            if store:
+                with profiler.stage('store'):
+                    store.add_metrics(table)
+            with profiler.stage('report'):
+                summary = summarize_metrics(table)
+                print_metrics(summary)
+                exportar_csv(table)
+                export_summary(summary)
+            if calculated.get('duplicates'):
+                print(' - {} módulos com conteúdo idêntico a outro calculados uma única vez'.format(calculated['duplicates']))
+        if 'loc' in args:
+            with profiler.stage('loc'):
+                modules, totals = get_LOC(config, identifier, converter)
+            print(';'.join(('módulo', 'camada') + LINES))
+            for row in modules:
+                print(';'.join('{}'.format(value) for value in row))
+            total = [0] * len(LINES)
+            for layer, counts in totals.items():
+                print_lines(layer, counts)
+                total = [value + count for value, count in zip(total, counts)]
+            print_lines('total', total)
+        if 'checker' in args:
+            added = start_analysis(config, identifier, converter, store)
+        if 'watch' in args:
+            watch(config)
+        if 'trends' in args:
+            print_trends(store.trends())
+    else:
+        added = start_analysis(config, identifier, converter, store)
+    if store:
+        store.commit()
+        store.close()
+    return added
+
+
+def print_lines(name, counts):
+    print('{}: {}'.format(name, ', '.join('{} {}'.format(count, label) for count, label in zip(counts, LINES))))
+
+
+def print_trends(runs):
+    print('{:>5} {:<19} {:<10} {:>8} {:>8} '.format('exec.', 'data', 'revisão', 'mccabe', 'sql') +
+          ' '.join('{:>8}'.format(''.join(word[0] for word in smell.split())) for smell in SMELLS))
+    for run, started, revision, mccabe, sql, counts in runs:
+        print('{:>5} {:<19} {:<10} {:>8} {:>8} '.format(run, started, (revision or '-')[:10],
+                                                       '-' if mccabe is None else '{:.2f}'.format(mccabe),
+                                                       '-' if sql is None else '{:.2f}'.format(sql)) +
+              ' '.join('{:>8}'.format(counts.get(smell, 0)) for smell in SMELLS))
+
+
+def run_profile(args, config):
+    '''
+        Executa a análise medindo cada etapa, cada regra e cada módulo.
+        --profile=arquivo.json define o relatório (padrão profile.json), --profile_top o número de módulos
+            mais lentos e --pstats=arquivo grava também o perfil do cProfile.
+    '''
+    profiler.start(int(config.get('profile_top', 10)))
+    # as regras são medidas no próprio processo
+    config['jobs'] = '1'
+    if config.get('pstats'):
+        stats = cProfile.Profile()
+        added = stats.runcall(run, args, config)
+        stats.dump_stats(config['pstats'])
+    else:
+        added = run(args, config)
+    report = profiler.stop().save(config['profile'] or 'profile.json')
+    profiler.print_profile(report)
+    return added
 
 
 if __name__ == '__main__':
     print '### execução iniciada ###'
     config = get_config()
+    args = get_options(sys.argv, config, FLAGS)
+    added = 0
     if not config.has_key('project'):
         print '### Adicione no arquivo de configuração o diretório do projeto.'
+    elif config.has_key('profile'):
+        added = run_profile(args, config)
     else:
-        if len(sys.argv) > 1:
-            if 'metrics' in sys.argv:
-                files = get_files(config['project'])
-                methods, functions = get_metrics(config, files)
-                print_metrics(methods, functions)
-                exportar_csv(methods, functions)
-            if 'loc' in sys.argv:
-                files = get_files(config['project'])
-                total = 0
-                models = 0
-                views = 0
-                for filename in files:
-                    if ('views' in filename or 'models' in filename or 'admin' in filename or 'forms' in filename):
-                        loc = get_LOC(filename)
-                        total += loc
-                        if 'models' in filename:
-                            models += loc
-                        else:
-                            views += loc
-                        print '{};{}'.format(filename, loc)
-                print 'Model: {}'.format(models)
-                print 'View: {}'.format(views)
-                print 'Total: {}'.format(total)
-            if 'checker' in sys.argv:
-                start_analysis(config)
-        else:
-            start_analysis(config)
+        added = run(args, config)
     print '### execução finalizada ###'
-
+    # violações novas em relação à baseline falham a execução (integração contínua)
+    sys.exit(1 if added else 0)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Medições de desempenho da própria ferramenta (benchmarking.py mede o código analisado).
+#
+#   python performance.py halstead
+#   python performance.py violations [--count 300000]
+#   python performance.py strings [--num-strings 20000]
+#   python performance.py pipeline --num-apps 10 --num-models 20 --num-views 20 [--output atual.json] [--baseline anterior.json]
+#   python performance.py startup [--repeat 5] [--budget 0.1]
+
+import os
+import sys
+import ast
+import json
+import time
+import random
+import shutil
+import tempfile
+import subprocess
+from complexity import HalsteadComplexity
+from checker import (SQLComplexity, Violation, MeddlingViewVisitor, MeddlingModelVisitor, mapping_relationships,
+                     create_rules, check_module, iter_violations, complexities, strings)
+from converter import SourceToAST
+from identifier import Identifier
+from profiler import peak_rss
+from symbols import SymbolTable
+from report import export_csv
+
+SQL = ('select a.id, b.nome, count(c.id), sum(c.valor) from app_a a '
+       'inner join app_b b on b.a_id = a.id left outer join app_c c on c.b_id = b.id '
+       'where a.ativo = 1 and (b.tipo in (1, 2, 3) or c.valor >= 100) and not exists '
+       '(select 1 from app_d d where d.a_id = a.id and d.data between %s and %s) '
+       'group by a.id, b.nome having count(c.id) > 1 order by a.id desc limit 10\n')
+
+
+def sql_corpus(size):
+    '''
+        Gera um SQL com aproximadamente size bytes.
+    '''
+    return SQL * max(1, size // len(SQL))
+
+
+def measure(function, repeat):
+    '''
+        Retorna o menor tempo de execução entre as repetições.
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_halstead(sizes=(1024, 16 * 1024, 256 * 1024, 1024 * 1024), repeat=5):
+    '''
+        Vazão de HalsteadComplexity.calcule_difficulty em SQLs de tamanhos crescentes.
+    '''
+    sql = SQLComplexity()
+    results = []
+    for size in sizes:
+        source = sql_corpus(size)
+        elapsed = measure(lambda: sql.complexity(source), repeat)
+        tokens = len(sql_tokens(source))
+        results.append({'bytes': len(source), 'tokens': tokens, 'seconds': elapsed,
+                        'mb_per_second': len(source) / elapsed / 1024 / 1024,
+                        'tokens_per_second': tokens / elapsed})
+    return results
+
+
+def sql_tokens(source):
+    return HalsteadComplexity.TOKEN.findall(source.lower())
+
+
+def print_results(title, results):
+    print(title)
+    for result in results:
+        print('  {bytes:>10} bytes {tokens:>9} tokens {seconds:>10.5f}s {mb_per_second:>8.2f} MB/s '
+              '{tokens_per_second:>12.0f} tokens/s'.format(**result))
+
+
+STRINGS = ('{sql}', '<div class="item">{n}</div>', '<p>{n}</p>', 'mensagem {n} para o usuário', 'campo_{n}', '  ( {sql}',
+           '<BR/>linha {n}', 'select_{n}', '%s-%s', '')
+
+
+def string_module(count):
+    '''
+        Gera um módulo com count strings (SQL, HTML e texto), metade delas repetidas.
+    '''
+    lines = []
+    for n in range(count):
+        value = STRINGS[n % len(STRINGS)].format(n=n % (count // 2 or 1), sql=SQL.strip())
+        if n % 20 == 0:
+            lines.append('\ndef funcao{}(request):'.format(n))
+        lines.append('    valor{} = {!r}'.format(n, value))
+    return '\n'.join(lines) + '\n'
+
+
+def benchmark_strings(count=20000, repeat=5):
+    '''
+        Classificação das strings (SQL/HTML) por MeddlingViewVisitor e MeddlingModelVisitor em um módulo com muitas strings.
+    '''
+    node = ast.parse(string_module(count))
+    def check():
+        strings.clear()
+        check_module('app.views', node, [MeddlingViewVisitor('app.views'), MeddlingModelVisitor('app.views')])
+    elapsed = measure(check, repeat)
+    return {'strings': count, 'seconds': elapsed, 'strings_per_second': count / elapsed}
+
+
+def benchmark_violations(count):
+    '''
+        Memória ocupada por count violações com apps, módulos, classes e métodos repetidos,
+            como em um projeto legado com muitas violações.
+    '''
+    smells = ['Meddling View', 'Meddling Model', 'Improper Use of Manager', 'Brain Persistence Method', 'Laborious Persistence Method']
+    before = peak_rss()
+    start = time.time()
+    violations = []
+    for i in range(count):
+        violations.append(Violation('app{}.views'.format(i % 50), 'Classe{}'.format(i % 400),
+                                    'metodo{}'.format(i % 900), i, smells[i % len(smells)]))
+    elapsed = time.time() - start
+    growth = peak_rss() - before
+    return {'violations': count, 'seconds': elapsed, 'mb': growth, 'bytes_per_violation': growth * 1024 * 1024 / count}
+
+
+MODEL = '''
+class {name}({base}):
+    codigo = models.CharField(max_length=10)
+    objects = models.Manager()
+    ativos = {manager}()
+{fields}
+    class Meta:
+        verbose_name = '{name}'
+
+    def __unicode__(self):
+        return '<span class="codigo">%s</span>' % self.codigo
+
+    def resumo(self):
+        total = 0
+        for item in {other}.objects.filter(codigo=self.codigo):
+            if item.codigo and total > 10:
+                total += 1
+            elif item.codigo:
+                total -= 1
+        return {other}.ativos.raw("{sql}")
+'''
+
+VIEW = '''
+def {name}(request, pk):
+    cursor = connection.cursor()
+    cursor.execute("{sql}")
+    sql = "{sql}"
+    cursor.execute(sql, [pk])
+    itens = {model}.objects.raw("select * from {table} where id = %s", [pk])
+    if request.GET.get('q'):
+        itens = [item for item in itens if item.codigo]
+    elif request.GET.get('p'):
+        for item in itens:
+            if item.codigo and pk:
+                break
+    return '<div class="lista"><p>%s</p></div>' % len(itens)
+
+
+class {name}View(object):
+
+    def get(self, request):
+        return {model}.ativos.all()
+'''
+
+
+def generate_project(directory, apps=10, models=20, views=20, seed=0):
+    '''
+        Gera um projeto Django sintético com cadeias de ForeignKey/ManyToMany, managers customizados,
+            views com SQL e HTML, admin e forms.
+        Retorna a lista de arquivos gerados.
+    '''
+    rand = random.Random(seed)
+    files = []
+    
+    def write(path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(content.encode('utf8'))
+        files.append(path)
+    
+    for a in range(apps):
+        app = 'app{}'.format(a)
+        root = os.path.join(directory, app)
+        write(os.path.join(root, '__init__.py'), '')
+        write(os.path.join(root, 'managers.py'), 'from django.db import models\n\n\n'
+              'class {0}Manager(models.Manager):\n    def get_queryset(self):\n'
+              '        return super({0}Manager, self).get_queryset().filter(ativo=True)\n'.format(app.capitalize()))
+        source = ['from django.db import models', 'from {}.managers import {}Manager'.format(app, app.capitalize())]
+        if a > 0:
+            source.append('from app{0}.models import App{0}Model0'.format(a - 1))
+        source.append('\n\nclass {}Base(models.Model):\n    ativo = models.BooleanField()\n\n'
+                      '    class Meta:\n        abstract = True\n'.format(app.capitalize()))
+        for m in range(models):
+            name = '{}Model{}'.format(app.capitalize(), m)
+            base = rand.choice(['models.Model', '{}Base'.format(app.capitalize())])
+            fields = []
+            if m > 0:
+                fields.append('    anterior = models.ForeignKey({}Model{})'.format(app.capitalize(), m - 1))
+                fields.append("    relacionados = models.ManyToManyField('{}Model{}')".format(app.capitalize(), rand.randrange(m)))
+            if a > 0:
+                fields.append("    externo = models.ForeignKey('app{0}.App{0}Model{1}')".format(a - 1, rand.randrange(models)))
+            other = '{}Model{}'.format(app.capitalize(), rand.randrange(m)) if m > 0 else name
+            source.append(MODEL.format(name=name, base=base, manager='{}Manager'.format(app.capitalize()),
+                                       fields='\n'.join(fields), other=other, sql=SQL.strip()))
+        write(os.path.join(root, 'models.py'), '\n'.join(source))
+        source = ['from django.db import connection', 'from {}.models import *'.format(app)]
+        for v in range(views):
+            model = '{}Model{}'.format(app.capitalize(), rand.randrange(models))
+            source.append(VIEW.format(name='view{}'.format(v), model=model, table=model.lower(), sql=SQL.strip()))
+        write(os.path.join(root, 'views.py'), '\n'.join(source))
+        write(os.path.join(root, 'admin.py'), 'from django.contrib import admin\nfrom {0}.models import {1}Model0\n\n'
+              'admin.site.register({1}Model0)\n'.format(app, app.capitalize()))
+        write(os.path.join(root, 'forms.py'), 'from django import forms\n\n\nclass {}Form(forms.Form):\n'
+              '    codigo = forms.CharField(help_text="<b>código</b>")\n'.format(app.capitalize()))
+    return files
+
+
+class Stages():
+    '''
+        Registra o tempo, a vazão e o pico de memória de cada etapa.
+    '''
+    
+    def __init__(self):
+        self.results = []
+    
+    def run(self, name, files, function):
+        start = time.time()
+        value = function()
+        elapsed = time.time() - start
+        self.results.append({'stage': name, 'seconds': elapsed, 'files': files,
+                             'files_per_second': elapsed and files / elapsed or 0, 'peak_rss_mb': peak_rss()})
+        return value
+
+
+def benchmark_pipeline(config):
+    '''
+        Mede cada etapa da análise do projeto: identificação dos arquivos, conversão para AST, mapeamento
+            dos relacionamentos, cada regra do checker isoladamente, a análise completa e a exportação do CSV.
+        
+        As regras isoladas são aplicadas diretamente em todos os módulos. A etapa checker mede
+            checker.iter_violations com a configuração da execução (--jobs, --cache), como no manage.py:
+            verificação rápida do código fonte, módulos duplicados, cache e descarte dos ASTs.
+    '''
+    stages = Stages()
+    identifier = stages.run('get_files', 0, lambda: Identifier(config))
+    stages.results[-1]['files'] = len(identifier.files)
+    stages.results[-1]['files_per_second'] = len(identifier.files) / (stages.results[-1]['seconds'] or 1)
+    layers = identifier.all()
+    converter = SourceToAST(config)
+    files = set(layers['model'] + layers['view'] + layers['manager'])
+    stages.run('SourceToAST.parse', len(files), lambda: converter.parse(files))
+    models = converter.parse(layers['model'])
+    views = converter.parse(layers['view'])
+    managers = converter.parse(layers['manager'])
+    relationships = stages.run('mapping_relationships', len(models) + len(managers),
+                               lambda: mapping_relationships(models, managers))
+    
+    for layer, nodes in (('view', views), ('model', models)):
+        for position in range(len(create_rules(layer, '-.-', relationships, config))):
+            name = create_rules(layer, '-.-', relationships, config)[position].__class__.__name__
+            complexities.clear()
+            stages.run('{} ({})'.format(name, layer), len(nodes),
+                       lambda: [check_module(key, nodes[key], [create_rules(layer, key, relationships, config)[position]],
+                                             SymbolTable(relationships))
+                                for key in nodes.keys()])
+    
+    complexities.clear()
+    strings.clear()
+    # um novo converter, para que a conversão sob demanda e o descarte dos ASTs sejam medidos como na análise
+    loaded = SourceToAST(config).load_layers(layers)
+    violations = stages.run('checker', len(views) + len(models),
+                            lambda: list(iter_violations(loaded['model'], loaded['view'], loaded['manager'], config)))
+    
+    directory = tempfile.mkdtemp()
+    try:
+        stages.run('report.export_csv', len(views) + len(models),
+                   lambda: export_csv(['design problem', 'app', 'module', 'class', 'function', 'line'], violations,
+                                      os.path.join(directory, 'design_problems_details.csv')))
+    finally:
+        shutil.rmtree(directory)
+    return stages.results
+
+
+# módulos importados somente pelos subcomandos que os utilizam (report e complexity)
+DEFERRED = ('pandas', 'numpy', 'mccabe')
+
+# executado em um processo novo: mede o import do manage.py e o tempo acumulado de cada import
+#   feito durante ele (como python -X importtime, que não existe no python 2)
+STARTUP = '''
+import sys, json, time, __builtin__
+original = __builtin__.__import__
+imports = {}
+def timed(name, *args, **kwargs):
+    if name in sys.modules:
+        return original(name, *args, **kwargs)
+    start = time.time()
+    try:
+        return original(name, *args, **kwargs)
+    finally:
+        imports.setdefault(name, time.time() - start)
+__builtin__.__import__ = timed
+start = time.time()
+import manage
+json.dump({'seconds': time.time() - start, 'imports': imports, 'modules': sorted(sys.modules)}, sys.stdout)
+'''
+
+
+def benchmark_startup(repeat=5):
+    '''
+        Tempo de inicialização do manage.py (menor entre as repetições, cada uma em um processo novo),
+            os imports mais lentos e os módulos de DEFERRED carregados na inicialização.
+    '''
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP], cwd=os.path.dirname(os.path.abspath(__file__)))
+        result = json.loads(output)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return {'seconds': best['seconds'],
+            'imports': sorted(best['imports'].items(), key=lambda item: -item[1]),
+            'deferred': [name for name in DEFERRED if name in best['modules']]}
+
+
+def print_stages(results):
+    print('{:<45} {:>10} {:>8} {:>12} {:>10}'.format('etapa', 'segundos', 'arquivos', 'arquivos/s', 'pico MB'))
+    for result in results:
+        print('{stage:<45} {seconds:>10.4f} {files:>8} {files_per_second:>12.1f} {peak_rss_mb:>10.1f}'.format(**result))
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+        Retorna as etapas cuja vazão caiu mais que a tolerância em relação à medição anterior.
+    '''
+    previous = dict((result['stage'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get(result['stage'])
+        if old and old['files_per_second'] and result['files_per_second'] < old['files_per_second'] * (1 - tolerance):
+            regressions.append((result['stage'], old['files_per_second'], result['files_per_second']))
+    return regressions
+
+
+if __name__ == '__main__':
+    from manage import get_options
+    options = {'num-apps': '10', 'num-models': '20', 'num-views': '20', 'tolerance': '0.2',
+               'managers': 'models', 'min_mccabe_complexity': '2', 'max_mccabe_complexity': '3',
+               'min_sql_complexity': '6', 'max_sql_complexity': '10'}
+    args = get_options(sys.argv, options)
+    if 'halstead' in args or len(args) == 0:
+        print_results('HalsteadComplexity.calcule_difficulty', benchmark_halstead())
+    if 'violations' in args:
+        # executado antes das demais medições, o pico de memória só é confiável em um processo novo
+        print('{violations} violações {seconds:.4f}s {mb:.1f} MB {bytes_per_violation:.0f} bytes/violação'.format(
+            **benchmark_violations(int(options.get('count', 300000)))))
+    if 'strings' in args:
+        print('MeddlingViewVisitor + MeddlingModelVisitor: {strings} strings {seconds:.4f}s {strings_per_second:.0f} strings/s'.format(
+            **benchmark_strings(int(options.get('num-strings', 20000)))))
+    if 'pipeline' in args:
+        project = options.get('project') or tempfile.mkdtemp()
+        try:
+            if not options.has_key('project'):
+                generate_project(project, int(options['num-apps']), int(options['num-models']), int(options['num-views']))
+            config = dict(options, project=project)
+            results = benchmark_pipeline(config)
+        finally:
+            if not options.has_key('project'):
+                shutil.rmtree(project)
+        print_stages(results)
+        if options.has_key('output'):
+            json.dump(results, open(options['output'], 'w'), indent=2)
+        if options.has_key('baseline'):
+            regressions = compare(results, json.load(open(options['baseline'])), float(options['tolerance']))
+            for stage, old, new in regressions:
+                print('REGRESSÃO {}: {:.1f} -> {:.1f} arquivos/s'.format(stage, old, new))
+            if regressions:
+                sys.exit(1)
+    if 'startup' in args:
+        result = benchmark_startup(int(options.get('repeat', 5)))
+        for name, seconds in result['imports'][:10]:
+            print('{:>10.4f}s  {}'.format(seconds, name))
+        print('import manage: {:.4f}s'.format(result['seconds']))
+        for name in result['deferred']:
+            print('IMPORTADO NA INICIALIZAÇÃO: {}'.format(name))
+        budget = options.has_key('budget') and float(options['budget'])
+        if budget and result['seconds'] > budget:
+            print('ACIMA DO LIMITE: {:.4f}s > {:.4f}s'.format(result['seconds'], budget))
+        if result['deferred'] or (budget and result['seconds'] > budget):
+            sys.exit(1)
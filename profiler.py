@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Perfil de execução da análise (manage.py --profile): tempo, chamadas e memória de cada etapa,
+#   tempo de cada regra (visitor) e os módulos mais lentos.
+
+import gc
+import sys
+import json
+import time
+import resource
+from collections import OrderedDict
+
+# perfil da execução atual, None quando o --profile não foi informado
+current = None
+
+
+def start(top=10):
+    global current
+    current = Profile(top)
+    return current
+
+
+def stop():
+    global current
+    profile, current = current, None
+    return profile
+
+
+def peak_rss():
+    '''
+        Pico de memória residente do processo em MB.
+    '''
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return usage / 1024.0 / 1024
+    return usage / 1024.0
+
+
+class Stage():
+    '''
+        Mede um trecho da execução quando o perfil está ativo.
+
+        memory=False não conta os objetos alocados, usado em trechos executados para cada módulo
+            (gc.get_objects percorre todos os objetos do processo).
+    '''
+
+    def __init__(self, name, memory=True):
+        self.name = name
+        self.memory = memory
+        self.profile = None
+
+    def __enter__(self):
+        self.profile = current
+        if self.profile:
+            if self.memory:
+                self.objects = len(gc.get_objects())
+                self.rss = peak_rss()
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile:
+            elapsed = time.time() - self.start
+            if self.memory:
+                self.profile.add_stage(self.name, elapsed, len(gc.get_objects()) - self.objects, peak_rss() - self.rss)
+            else:
+                self.profile.add_stage(self.name, elapsed)
+        return False
+
+
+def stage(name, memory=True):
+    return Stage(name, memory)
+
+
+class Profile():
+    '''
+        Tempos acumulados por etapa, por regra e por módulo.
+
+        As etapas podem ser aninhadas (ex.: mapping_relationships dentro de checker), então a soma dos
+            tempos das etapas não é o tempo total da execução.
+    '''
+
+    def __init__(self, top=10):
+        self.top = top
+        self.started = time.time()
+        self.stages = OrderedDict()
+        self.rules = {}
+        self.modules = {}
+
+    def add_stage(self, name, seconds, objects=None, rss=None):
+        entry = self.stages.setdefault(name, {'stage': name, 'seconds': 0.0, 'calls': 0})
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        if objects is not None:
+            entry['objects'] = entry.get('objects', 0) + objects
+            entry['rss_growth_mb'] = entry.get('rss_growth_mb', 0) + rss
+
+    def add_module(self, module, seconds):
+        self.modules[module] = self.modules.get(module, 0) + seconds
+
+    def instrument(self, rules):
+        '''
+            Substitui enter e leave de cada regra por versões que acumulam o tempo gasto pela regra.
+            calls é o número de nós despachados para a regra.
+        '''
+        for rule in rules:
+            name = rule.__class__.__name__
+            if not self.rules.has_key(name):
+                self.rules[name] = {'rule': name, 'seconds': 0.0, 'calls': 0, 'modules': 0}
+            self.rules[name]['modules'] += 1
+            rule.enter = self.timed(self.rules[name], rule.enter, 1)
+            rule.leave = self.timed(self.rules[name], rule.leave, 0)
+
+    def timed(self, entry, method, calls):
+        def wrapper(node):
+            start = time.time()
+            result = method(node)
+            entry['seconds'] += time.time() - start
+            entry['calls'] += calls
+            return result
+        return wrapper
+
+    def report(self):
+        modules = sorted(self.modules.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        return {'seconds': time.time() - self.started,
+                'stages': self.stages.values(),
+                'rules': sorted(self.rules.values(), key=lambda entry: entry['seconds'], reverse=True),
+                'modules': [{'module': module, 'seconds': seconds} for module, seconds in modules]}
+
+    def save(self, filename):
+        report = self.report()
+        json.dump(report, open(filename, 'w'), indent=2)
+        return report
+
+
+def print_profile(report):
+    print('Tempo total: {:.4f}s'.format(report['seconds']))
+    print('{:<30} {:>10} {:>8} {:>12} {:>10}'.format('etapa', 'segundos', 'chamadas', 'objetos', '+RSS MB'))
+    for entry in report['stages']:
+        print('{:<30} {:>10.4f} {:>8} {:>12} {:>10}'.format(entry['stage'], entry['seconds'], entry['calls'],
+                                                           entry.get('objects', '-'),
+                                                           '{:.1f}'.format(entry['rss_growth_mb']) if entry.has_key('rss_growth_mb') else '-'))
+    print('{:<40} {:>10} {:>10} {:>8}'.format('regra', 'segundos', 'nós', 'módulos'))
+    for entry in report['rules']:
+        print('{rule:<40} {seconds:>10.4f} {calls:>10} {modules:>8}'.format(**entry))
+    print('{:<60} {:>10}'.format('módulo', 'segundos'))
+    for entry in report['modules']:
+        print('{module:<60} {seconds:>10.4f}'.format(**entry))
@@ -2,237 +2,160 @@
 from __future__ import unicode_literals
 
 import csv
-import pandas as pd
+import json
+from collections import OrderedDict
+
+# pandas e numpy são importados somente nas funções das métricas, para que os subcomandos que apenas
+#   gravam as violações (checker, loc, watch) não paguem a importação deles na inicialização
 
 
 def export_csv(head=[], datalist=[], filename='export_csv.csv', delimitator=';'):
     c = csv.writer(open(filename, "wb"))
     c.writerow(head)
     for data in datalist:
-        c.writerow(data.__str__().split(delimitator))
+        if hasattr(data, 'fields'):
+            c.writerow(data.fields())
+        elif isinstance(data, (list, tuple)):
+            c.writerow(data)
+        else:
+            c.writerow(data.__str__().split(delimitator))
     print('   - {}'.format(filename))
 
-def exportar_csv(methods, functions):
+# camadas do resumo das métricas, na ordem de impressão; o módulo pertence à primeira cujo nome contém
+LAYERS = ('models', 'views', 'admin', 'forms')
+GROUPS = ('todos',) + LAYERS + ('outros',)
+
+METRICS = (('mccabe', 'Complexidade Ciclomática', 'Total de métodos'),
+           ('sql', 'Complexidade do SQL', 'Total de métodos com SQL'))
+
+
+def get_layer(module):
+    for layer in LAYERS:
+        if layer in module:
+            return layer
+    return 'outros'
+
+
+def metrics_table(modules):
+    '''
+        Métricas de todas as funções em uma única tabela (layer, app, module, class, function, mccabe, sql).
+            modules são os pares (módulo, linhas [classe, função, mccabe, sql]) de benchmarking.get_metrics.
+            A complexidade do SQL das funções sem SQL (-1) é NaN, e não entra nas estatísticas do SQL.
+    '''
+    import numpy as np
+    import pandas as pd
+    columns = OrderedDict((name, []) for name in ('layer', 'app', 'module', 'class', 'function', 'mccabe', 'sql'))
+    for module, rows in modules:
+        if not rows:
+            continue
+        # camada, app e módulo calculados uma única vez para todas as funções do módulo
+        keys = module.split('.')
+        count = len(rows)
+        columns['layer'].extend([get_layer(module)] * count)
+        columns['app'].extend([keys[0]] * count)
+        columns['module'].extend([keys[1] if len(keys) > 1 else '-'] * count)
+        for name, values in zip(('class', 'function', 'mccabe', 'sql'), zip(*rows)):
+            columns[name].extend(values)
+    columns['mccabe'] = np.array(columns['mccabe'], dtype='int64')
+    sql = np.array(columns['sql'], dtype='float64')
+    columns['sql'] = np.where(sql == -1, np.nan, sql)
+    return pd.DataFrame(columns)
+
+
+def low(series):
+    return series.quantile(q=0.25)
+
+
+def medium(series):
+    return series.quantile(q=0.5)
+
+
+def high(series):
+    return series.quantile(q=0.75)
+
+
+def mode(series):
+    return list(series.mode())
+
+
+def mad(series):
+    # desvio absoluto médio (Series.mad não existe nas versões recentes do pandas)
+    return (series - series.mean()).abs().mean()
+
+
+STATISTICS = (('count', 'Total'), ('mean', 'Média'), ('median', 'Mediana'), (low, 'Quantil (LOW)'),
+              (medium, 'Quantil (MEDIUM)'), (high, 'Quantil (HIGH)'), (mode, 'Moda'), ('min', 'Mínima'),
+              ('max', 'Máxima'), ('var', 'Variância'), ('std', 'Desvio Padrão'), (mad, 'Desvio Absoluto'))
+
+
+def summarize_metrics(table):
+    '''
+        Estatísticas da complexidade ciclomática e do SQL de todas as funções e de cada camada, calculadas
+            em uma única agregação agrupada. A complexidade do SQL é arredondada em duas casas.
+        Retorna uma tabela indexada por (grupo, métrica) com uma coluna por estatística.
+    '''
+    import pandas as pd
+    values = table[['layer', 'mccabe', 'sql']].assign(sql=table['sql'].round(2))
+    # o grupo "todos" é uma cópia das linhas, para que todos os grupos sejam calculados na mesma agregação
+    values = pd.concat([values.assign(layer='todos'), values], ignore_index=True)
+    names = [getattr(function, '__name__', function) for function, label in STATISTICS]
+    summary = values.groupby('layer')[['mccabe', 'sql']].agg([function for function, label in STATISTICS])
+    summary = summary.stack(0)[names].reindex(pd.MultiIndex.from_product([GROUPS, ['mccabe', 'sql']]))
+    summary.index.names = ['group', 'metric']
+    summary['count'] = summary['count'].fillna(0).astype('int64')
+    summary['mode'] = summary['mode'].apply(lambda value: value if isinstance(value, list) else [])
+    return summary
+
+
+def format_statistic(metric, name, value):
+    import pandas as pd
+    if name == 'mode':
+        return ', '.join(format_statistic(metric, 'min', item) for item in value)
+    if pd.isnull(value):
+        return 'nan'
+    if name == 'count' or (metric == 'mccabe' and name in ('min', 'max')):
+        return '{}'.format(int(value))
+    return '{!r}'.format(float(value))
+
+
+def print_metrics(summary):
+    for group in GROUPS:
+        for metric, title, total in METRICS:
+            statistics = summary.loc[(group, metric)]
+            print('[{}] {}:  {}'.format(group, total, statistics['count']))
+            for (function, label), name in zip(STATISTICS[1:], summary.columns[1:]):
+                print('{} {}:  {}'.format(title, label, format_statistic(metric, name, statistics[name])))
+            print('--------------------------------------------\n' if metric == 'mccabe' else '############################################\n')
+
+
+def export_summary(summary, filename='metrics_summary'):
+    '''
+        Grava as estatísticas em CSV e JSON.
+    '''
+    import pandas as pd
+    rows = []
+    for (group, metric), statistics in summary.iterrows():
+        rows.append([group, metric] + [format_statistic(metric, name, statistics[name]) for name in summary.columns])
+    export_csv(['group', 'metric'] + list(summary.columns), rows, '{}.csv'.format(filename))
+    records = []
+    for (group, metric), statistics in summary.iterrows():
+        record = OrderedDict([('group', group), ('metric', metric)])
+        for name in summary.columns:
+            value = statistics[name]
+            if name == 'count':
+                record[name] = int(value)
+            elif name == 'mode':
+                record[name] = [float(item) for item in value]
+            else:
+                record[name] = None if pd.isnull(value) else float(value)
+        records.append(record)
+    json.dump(records, open('{}.json'.format(filename), 'w'), indent=2)
+    print('   - {}.json'.format(filename))
+
+
+def exportar_csv(table):
+    import pandas as pd
     c = csv.writer(open("metrics_report.csv", "wb"))
     c.writerow(["app", "modulo", "classe", "metodo", "mccabe", "sql"])
-    for key in methods.keys():
-        keys = key.split('.')
-        values = methods[key].split(';')
-        c.writerow([keys[0], keys[1], keys[-2], keys[-1], values[0], values[1]])
-        
-    for key in functions.keys():
-        keys = key.split('.')
-        values = functions[key].split(';')
-        c.writerow([keys[0], keys[1], '-', keys[-1], values[0], values[1]])
-
-
-def print_metrics(methods, functions):
-    methods.update(functions)
-    list_complexidade_ciclomatica = []
-    list_complexidade_sql = []
-    list_complexidade_ciclomatica_models = []
-    list_complexidade_sql_models = []
-    list_complexidade_ciclomatica_views = []
-    list_complexidade_sql_views = []
-    list_complexidade_ciclomatica_admin = []
-    list_complexidade_sql_admin = []
-    list_complexidade_ciclomatica_forms = []
-    list_complexidade_sql_forms = []
-    list_complexidade_ciclomatica_outros = []
-    list_complexidade_sql_outros = []
-    for key in methods.keys():
-        values = methods[key].split(';')
-        contains_sql = values[1] != '-1'
-        list_complexidade_ciclomatica.append(int(values[0]))
-        if contains_sql:
-            list_complexidade_sql.append(round(float(values[1]),2))
-        if 'models' in key:
-            list_complexidade_ciclomatica_models.append(int(values[0]))
-            if contains_sql:
-                list_complexidade_sql_models.append(round(float(values[1]),2))
-        elif 'views' in key:
-            list_complexidade_ciclomatica_views.append(int(values[0]))
-            if contains_sql:
-                list_complexidade_sql_views.append(round(float(values[1]),2))
-        elif 'admin' in key:
-            list_complexidade_ciclomatica_admin.append(int(values[0]))
-            if contains_sql:
-                list_complexidade_sql_admin.append(round(float(values[1]),2))
-        elif 'forms' in key:
-            list_complexidade_ciclomatica_forms.append(int(values[0]))
-            if contains_sql:
-                list_complexidade_sql_forms.append(round(float(values[1]),2))
-        else:
-            list_complexidade_ciclomatica_outros.append(int(values[0]))
-            if contains_sql:
-                list_complexidade_sql_outros.append(float(values[1]))
-    
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica)
-    print '[todos] Total de métodos: ', len(list_complexidade_ciclomatica)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql)
-    print '[todos] Total de métodos com SQL: ', len(list_complexidade_sql)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica_models)
-    print '[models] Total de métodos: ', len(list_complexidade_ciclomatica_models)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql_models)
-    print '[models] Total de métodos com SQL: ', len(list_complexidade_sql_models)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica_views)
-    print '[views] Total de métodos: ', len(list_complexidade_ciclomatica_views)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql_views)
-    print '[views] Total de métodos com SQL: ', len(list_complexidade_sql_views)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica_admin)
-    print '[admin] Total de métodos: ', len(list_complexidade_ciclomatica_admin)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql_admin)
-    print '[admin] Total de métodos com SQL: ', len(list_complexidade_sql_admin)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica_forms)
-    print '[forms] Total de métodos: ', len(list_complexidade_ciclomatica_forms)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql_forms)
-    print '[forms] Total de métodos com SQL: ', len(list_complexidade_sql_forms)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-    series_complexidade_ciclomatica = pd.Series(list_complexidade_ciclomatica_outros)
-    print '[outros] Total de métodos: ', len(list_complexidade_ciclomatica_outros)
-    print 'Complexidade Ciclomática Média: ', series_complexidade_ciclomatica.mean()
-    print 'Complexidade Ciclomática Mediana: ', series_complexidade_ciclomatica.median()
-    print 'Complexidade Ciclomática Quantil (LOW): ', series_complexidade_ciclomatica.quantile(q=0.25)
-    print 'Complexidade Ciclomática Quantil (MEDIUM): ', series_complexidade_ciclomatica.quantile(q=0.5)
-    print 'Complexidade Ciclomática Quantil (HIGH): ', series_complexidade_ciclomatica.quantile(q=0.75)
-    print 'Complexidade Ciclomática Moda: ', series_complexidade_ciclomatica.mode()
-    print 'Complexidade Ciclomática Mínima: ', series_complexidade_ciclomatica.min()
-    print 'Complexidade Ciclomática Máxima: ', series_complexidade_ciclomatica.max()
-    print 'Complexidade Ciclomática Variância: ', series_complexidade_ciclomatica.var()
-    print 'Complexidade Ciclomática Desvio Padrão: ', series_complexidade_ciclomatica.std()
-    print 'Complexidade Ciclomática Desvio Absoluto: ', series_complexidade_ciclomatica.mad()
-    print '--------------------------------------------\n'
-    series_complexidade_sql = pd.Series(list_complexidade_sql_outros)
-    print '[outros] Total de métodos com SQL: ', len(list_complexidade_sql_outros)
-    print 'Complexidade do SQL Média: ', series_complexidade_sql.mean()
-    print 'Complexidade do SQL Mediana: ', series_complexidade_sql.median()
-    print 'Complexidade do SQL Quantil (LOW): ', series_complexidade_sql.quantile(q=0.25)
-    print 'Complexidade do SQL Quantil (MEDIUM): ', series_complexidade_sql.quantile(q=0.5)
-    print 'Complexidade do SQL Quantil (HIGH): ', series_complexidade_sql.quantile(q=0.75)
-    print 'Complexidade do SQL Moda: ', series_complexidade_sql.mode()
-    print 'Complexidade do SQL Mínima: ', series_complexidade_sql.min()
-    print 'Complexidade do SQL Máxima: ', series_complexidade_sql.max()
-    print 'Complexidade do SQL Variância: ', series_complexidade_sql.var()
-    print 'Complexidade do SQL Desvio Padrão: ', series_complexidade_sql.std()
-    print 'Complexidade do SQL Desvio Absoluto: ', series_complexidade_sql.mad()
-    print '############################################\n'
-
+    for app, module, cls, function, mccabe, sql in table[['app', 'module', 'class', 'function', 'mccabe', 'sql']].itertuples(index=False):
+        c.writerow([app, module, cls or '-', function, mccabe, -1 if pd.isnull(sql) else '{}'.format(sql)])
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Análise restrita às alterações de um intervalo de revisões do git (--diff), para verificar somente
+#   as violações introduzidas por um pull request.
+
+import os
+import re
+import sys
+import ast
+import subprocess
+from collections import Counter
+from converter import ModuleNodes
+from checker import mapping_relationships, check_layer_module
+
+HUNK = re.compile(r'^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# violações registradas na linha da função, que valem para qualquer linha alterada dentro dela
+FUNCTION_SMELLS = ('Brain Persistence Method', 'Laborious Persistence Method')
+
+# regras que consultam os relacionamentos e podem mudar em um módulo por alteração em outro
+RELATIONSHIP_SMELLS = ('Improper Use of Manager', 'Laborious Persistence Method')
+
+
+class Hunk():
+
+    def __init__(self, start, count):
+        self.start = start
+        self.count = count
+        self.removed = []
+
+    def lines(self):
+        '''
+            Primeira e última linha alterada na versão nova.
+        '''
+        if self.count == 0:
+            # somente remoção, entre a linha start e a seguinte
+            return self.start, self.start + 1
+        return self.start, self.start + self.count - 1
+
+
+def get_diff(project, revisions):
+    '''
+        Alterações dos arquivos python do projeto entre as revisões, no formato do git diff
+            (ex.: origin/master...HEAD ou HEAD~1 para comparar com a cópia de trabalho).
+        Retorna caminho -> lista de Hunk. Arquivos removidos não são incluídos.
+        As linhas removidas são mantidas em bytes, como o código fonte lido por converter.SourceToAST.
+        Encerra a execução se o git não estiver instalado, o projeto não estiver em um repositório git
+            ou as revisões não existirem (a mensagem do git é apresentada antes).
+    '''
+    try:
+        output = subprocess.check_output(['git', 'diff', '--no-color', '--no-ext-diff', '--relative', '-U0'] +
+                                         revisions.split() + ['--', '*.py'], cwd=project)
+    except (OSError, subprocess.CalledProcessError) as error:
+        if isinstance(error, OSError):
+            reason = 'git: {}'.format(error.strerror)
+        else:
+            reason = 'git diff retornou {}'.format(error.returncode)
+        print('### Não foi possível obter as alterações de --diff {} em {}: {}.'.format(revisions, project, reason))
+        sys.exit(1)
+    changes = {}
+    path = None
+    hunk = None
+    # linhas removidas e adicionadas que ainda faltam no hunk atual (podem começar com "--- " e "+++ ")
+    removed = added = 0
+    last = None
+    for line in output.splitlines():
+        if removed and line.startswith('-'):
+            hunk.removed.append(line[1:] + b'\n')
+            removed -= 1
+        elif added and line.startswith('+'):
+            added -= 1
+        elif line.startswith('\\'):
+            # "\ No newline at end of file" após uma linha removida
+            if last.startswith('-') and hunk and hunk.removed:
+                hunk.removed[-1] = hunk.removed[-1][:-1]
+        elif line.startswith('+++ '):
+            name = line[4:].strip().decode('utf8')
+            path = None if name == '/dev/null' else os.path.normpath(os.path.join(project, name[2:]))
+            if path:
+                changes[path] = []
+        elif path and line.startswith('@@'):
+            match = HUNK.match(line)
+            removed = 1 if match.group(1) is None else int(match.group(1))
+            hunk = Hunk(int(match.group(2)), 1 if match.group(3) is None else int(match.group(3)))
+            added = hunk.count
+            changes[path].append(hunk)
+        last = line
+    return changes
+
+
+def previous_source(source, hunks):
+    '''
+        Reconstrói o código fonte anterior às alterações a partir da versão nova (diff com -U0).
+    '''
+    lines = source.splitlines(True)
+    for hunk in reversed(hunks):
+        start = hunk.start if hunk.count == 0 else hunk.start - 1
+        lines[start:start + hunk.count] = hunk.removed
+    return b''.join(lines)
+
+
+def class_names(node):
+    return [item.name for item in node.body if isinstance(item, ast.ClassDef)]
+
+
+def function_spans(node):
+    '''
+        Última linha de cada função, indexada pela linha da definição.
+    '''
+    spans = {}
+    for item in ast.walk(node):
+        if isinstance(item, ast.FunctionDef):
+            end = max(child.lineno for child in ast.walk(item) if hasattr(child, 'lineno'))
+            spans[item.lineno] = max(end, spans.get(item.lineno, end))
+    return spans
+
+
+def overlaps(first, last, ranges):
+    for start, end in ranges:
+        if start <= last and first <= end:
+            return True
+    return False
+
+
+class DiffScope():
+    '''
+        Módulos alterados no intervalo de revisões e módulos afetados pelos modelos e managers alterados.
+
+        As violações dos módulos alterados são restritas às linhas alteradas. Os módulos não alterados
+            que referenciam uma classe dos modelos alterados também são verificados. Se um módulo
+            consultou um relacionamento que mudou, ele é verificado novamente com o mapa de
+            relacionamentos anterior, e as violações das regras que consultam os relacionamentos
+            que não aparecem nessa verificação também são mantidas (ex.: um novo manager torna uma
+            chamada existente em uma view um Improper Use of Manager).
+    '''
+
+    def __init__(self, config, layers, nodes, converter):
+        self.config = config
+        self.layers = nodes
+        changes = get_diff(config['project'], config['diff'])
+        # os modelos por último, pois já estão convertidos em AST
+        self.nodes = {}
+        for layer in ('view', 'manager', 'model'):
+            for key in nodes[layer].keys():
+                self.nodes[key] = nodes[layer]
+        self.ranges = {}
+        previous = {}
+        for layer, files in layers.items():
+            for filename in files:
+                hunks = changes.get(os.path.normpath(filename))
+                if hunks is not None:
+                    module = converter.module_name(filename)
+                    self.ranges[module] = [hunk.lines() for hunk in hunks]
+                    if layer in ('model', 'manager'):
+                        previous[module] = previous_source(nodes[layer].sources[module], hunks)
+        self.before = {}
+        self.relationships = self.get_changed_relationships(nodes, previous)
+        self.dependents = set()
+        if self.relationships:
+            self.dependents = self.get_dependents(previous, nodes) - set(self.ranges)
+        self.modules = set(self.ranges) | self.dependents
+        # chaves dos relacionamentos consultadas por cada módulo (checker.iter_violations)
+        self.consulted = {}
+        self.spans = {}
+        self.baselines = {}
+
+    def get_changed_relationships(self, nodes, previous):
+        '''
+            Chaves do mapa de relacionamentos com valor diferente do mapa das versões anteriores dos modelos e managers.
+        '''
+        if not previous:
+            return set()
+        layers = {}
+        for layer in ('model', 'manager'):
+            sources = dict(nodes[layer].sources)
+            cached = dict(nodes[layer].nodes)
+            for module, source in previous.items():
+                if sources.has_key(module):
+                    try:
+                        cached[module] = ast.parse(source)
+                    except SyntaxError:
+                        # versão anterior inválida, os relacionamentos dela são considerados iguais aos atuais
+                        continue
+                    sources[module] = source
+            layers[layer] = ModuleNodes(sources, cached)
+        before = self.before = mapping_relationships(layers['model'], layers['manager'])
+        after = mapping_relationships(nodes['model'], nodes['manager'])
+        return set(key for key in set(before) | set(after) if before.get(key) != after.get(key))
+
+    def get_dependents(self, previous, nodes):
+        '''
+            Módulos que referenciam alguma classe dos módulos alterados (antes ou depois da alteração).
+                Os modelos que referenciam uma dessas classes também podem ter os relacionamentos
+                alterados, então as classes deles também são consideradas.
+        '''
+        names = set()
+        for module, source in previous.items():
+            names.update(class_names(self.nodes[module][module]))
+            try:
+                names.update(class_names(ast.parse(source)))
+            except SyntaxError:
+                pass
+        models = nodes['model']
+        dependents = set(previous)
+        found = True
+        while names and found:
+            found = False
+            pattern = re.compile(r'\b(?:{})\b'.format('|'.join(sorted(names))))
+            for key in models.keys():
+                if key not in dependents and pattern.search(models.sources[key]):
+                    dependents.add(key)
+                    names.update(class_names(models[key]))
+                    found = True
+        if names:
+            pattern = re.compile(r'\b(?:{})\b'.format('|'.join(sorted(names))))
+            for key in nodes['view'].keys():
+                if pattern.search(nodes['view'].sources[key]):
+                    dependents.add(key)
+        return dependents
+
+    def function_end(self, module, line):
+        if not self.spans.has_key(module):
+            self.spans[module] = function_spans(self.nodes[module][module])
+        return self.spans[module].get(line, line)
+
+    def baseline(self, module):
+        '''
+            Violações do módulo (código atual) com o mapa de relacionamentos anterior às alterações.
+        '''
+        if not self.baselines.has_key(module):
+            found = Counter()
+            for layer in ('view', 'model'):
+                if self.layers[layer].has_key(module):
+                    violations, used = check_layer_module(module, layer, self.layers[layer], self.before, self.config)
+                    found.update((v.smell, v.cls, v.method, v.line) for v in violations)
+            self.baselines[module] = found
+        return self.baselines[module]
+
+    def is_new(self, violation):
+        '''
+            Violação que surgiu pela alteração de um relacionamento consultado pelo módulo.
+        '''
+        if violation.smell not in RELATIONSHIP_SMELLS or not self.consulted.get(violation.key, set()) & self.relationships:
+            return False
+        baseline = self.baseline(violation.key)
+        key = (violation.smell, violation.cls, violation.method, violation.line)
+        if baseline[key] > 0:
+            baseline[key] -= 1
+            return False
+        return True
+
+    def filter(self, violations):
+        for violation in violations:
+            ranges = self.ranges.get(violation.key)
+            if ranges is not None:
+                last = violation.line
+                if violation.smell in FUNCTION_SMELLS:
+                    last = self.function_end(violation.key, violation.line)
+                if overlaps(violation.line, last, ranges):
+                    yield violation
+                    continue
+            if self.is_new(violation):
+                yield violation
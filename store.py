@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Histórico dos resultados em SQLite (--store arquivo.db): cada execução grava as violações e as métricas
+#   de cada função, para consultar a evolução do projeto sem analisar novamente as revisões antigas.
+
+import os
+import math
+import sqlite3
+import datetime
+import subprocess
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started TEXT NOT NULL,
+        project TEXT NOT NULL,
+        revision TEXT
+    );
+    CREATE TABLE IF NOT EXISTS violations (
+        run INTEGER NOT NULL REFERENCES runs (id),
+        smell TEXT NOT NULL,
+        app TEXT NOT NULL,
+        module TEXT NOT NULL,
+        cls TEXT,
+        method TEXT,
+        line INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS metrics (
+        run INTEGER NOT NULL REFERENCES runs (id),
+        app TEXT NOT NULL,
+        module TEXT NOT NULL,
+        cls TEXT,
+        method TEXT NOT NULL,
+        mccabe INTEGER,
+        sql REAL
+    );
+    CREATE INDEX IF NOT EXISTS violations_run ON violations (run, smell);
+    CREATE INDEX IF NOT EXISTS violations_module ON violations (app, module, smell);
+    CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run);
+    CREATE INDEX IF NOT EXISTS metrics_module ON metrics (app, module);
+'''
+
+# linhas gravadas por comando (executemany), todas na transação da execução
+BATCH = 1000
+
+
+def get_revision(project):
+    '''
+        Revisão do git do projeto analisado, None se o projeto não estiver em um repositório git.
+    '''
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=project, stderr=null).strip().decode('utf8')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ResultStore():
+    '''
+        As linhas são acumuladas e gravadas em lotes, e a execução só é confirmada (commit) no final,
+            então uma análise interrompida não deixa uma execução incompleta no histórico.
+
+        A execução é criada na primeira gravação, consultas (trends) não criam execuções.
+    '''
+
+    def __init__(self, filename, project):
+        self.project = project
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+        self.run = None
+        self.violations = 0
+        self.metrics = 0
+
+    def start(self):
+        if self.run is None:
+            started = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.connection.execute('INSERT INTO runs (started, project, revision) VALUES (?, ?, ?)',
+                                             (started, self.project, get_revision(self.project)))
+            self.run = cursor.lastrowid
+        return self.run
+
+    def insert(self, sql, rows):
+        for start in range(0, len(rows), BATCH):
+            self.connection.executemany(sql, rows[start:start + BATCH])
+
+    def add_violations(self, violations):
+        '''
+            Grava as violações à medida que são geradas e as retorna. O módulo é o nome completo
+                (Violation.key), para diferenciar os módulos de um pacote (app.views.a e app.views.b).
+        '''
+        run = self.start()
+        rows = []
+        for v in violations:
+            rows.append((run, v.smell, v.app, v.key, v.cls, v.method, v.line))
+            if len(rows) == BATCH:
+                self.insert('INSERT INTO violations VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self.violations += len(rows)
+                rows = []
+            yield v
+        self.insert('INSERT INTO violations VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.violations += len(rows)
+
+    def add_metrics(self, table):
+        '''
+            Métricas de cada função (report.metrics_table). As funções sem SQL têm a complexidade do SQL NULL.
+        '''
+        run = self.start()
+        rows = []
+        for app, module, cls, function, mccabe, sql in table[['app', 'module', 'class', 'function', 'mccabe', 'sql']].itertuples(index=False):
+            rows.append((run, app, module, cls, function, int(mccabe), None if math.isnan(sql) else float(sql)))
+        self.insert('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.metrics += len(rows)
+
+    def trends(self):
+        '''
+            Número de violações de cada tipo e complexidade média por execução.
+        '''
+        runs = self.connection.execute('''
+            SELECT runs.id, runs.started, runs.revision,
+                   (SELECT AVG(mccabe) FROM metrics WHERE metrics.run = runs.id),
+                   (SELECT AVG(sql) FROM metrics WHERE metrics.run = runs.id)
+            FROM runs ORDER BY runs.id''').fetchall()
+        counts = {}
+        for run, smell, count in self.connection.execute('SELECT run, smell, COUNT(*) FROM violations GROUP BY run, smell'):
+            counts.setdefault(run, {})[smell] = count
+        return [(run, started, revision, mccabe, sql, counts.get(run, {})) for run, started, revision, mccabe, sql in runs]
+
+    def commit(self):
+        if self.run is None:
+            return
+        self.connection.commit()
+        print('   - execução {} gravada: {} violações, {} funções'.format(self.run, self.violations, self.metrics))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Tabela de símbolos do projeto: resolve cada nome importado ou definido em um módulo para o nome completo
+#   do destino, seguindo as reexportações dos módulos do modelo e dos managers
+#   (ex.: app/models/__init__.py com "from .pedido import Pedido").
+
+import re
+import ast
+
+# prefixo das reexportações de cada módulo no mapa de relacionamentos (checker.mapping_relationships)
+PREFIX = 'symbols:'
+
+# instruções do nível do módulo cujos blocos também são percorridos (imports condicionais)
+BLOCKS = (ast.If, ast.TryExcept, ast.TryFinally, ast.With)
+
+# nível, módulo e nomes de cada "from ... import" do código fonte (SymbolTable.imports_db)
+FROM_IMPORT = re.compile(r'\bfrom[\s\\]+(\.*)[\s\\]*([\w.]*)[\s\\]+import(?:[ \t]|\\\r?\n)*(\([^)]*\)|\*|[\w, \t]*(?:\\\r?\n[\w, \t]*)*)')
+NAME = re.compile(r'\w+')
+
+
+def import_module(module, level, name):
+    '''
+        Módulo de um ImportFrom, considerando o nível dos imports relativos. O módulo de um pacote é o
+            __init__, então o pacote é sempre o nome do módulo sem o último nível.
+    '''
+    if level == 0:
+        return name
+    parts = module.split('.')[:-1]
+    base = '.'.join(parts[:len(parts) - (level - 1)])
+    if name:
+        base = base and '{}.{}'.format(base, name) or name
+    return base
+
+
+def import_target(module, node, item):
+    '''
+        Nome completo importado por um item de um ImportFrom.
+    '''
+    return '{}.{}'.format(import_module(module, node.level, node.module), item.name)
+
+
+def model_key(target):
+    '''
+        Chave da classe no mapa de relacionamentos: as classes de um pacote models são identificadas
+            pelo pacote (app.models.pedido.Pedido -> app.models.Pedido), como em ScanModelRelationships.
+    '''
+    parts = target.split('.')
+    module = parts[:-1]
+    if len(module) == 3 and module[1] == 'models':
+        module = module[:2]
+    return '.'.join(module + parts[-1:])
+
+
+def module_exports(module, node):
+    '''
+        Imports do nível do módulo (nome local -> destino), que podem ser reexportados.
+    '''
+    exports = {}
+    statements = list(node.body)
+    while statements:
+        statement = statements.pop(0)
+        if isinstance(statement, ast.ImportFrom):
+            for item in statement.names:
+                if item.name != '*':
+                    exports[item.asname or item.name] = import_target(module, statement, item)
+        elif isinstance(statement, ast.Import):
+            for item in statement.names:
+                exports[item.asname or item.name] = item.name
+        elif isinstance(statement, BLOCKS):
+            for field in ('body', 'orelse', 'finalbody', 'handlers'):
+                statements.extend(getattr(statement, field, []))
+        elif isinstance(statement, ast.ExceptHandler):
+            statements.extend(statement.body)
+    return exports
+
+
+def mapping_symbols(models_node, managers_node, cache=None):
+    '''
+        Reexportações dos módulos do modelo e dos managers, indexadas por PREFIX + módulo.
+            Somente os módulos com imports são incluídos.
+    '''
+    symbols = {}
+    for nodes in (models_node, managers_node):
+        for key in nodes.keys():
+            if symbols.has_key(PREFIX + key):
+                continue
+            record = cache and cache.get('symbols', key, nodes.digest(key))
+            if record:
+                exports = record['exports']
+            else:
+                exports = module_exports(key, nodes[key])
+                if cache:
+                    cache.set('symbols', key, nodes.digest(key), {'exports': exports})
+            if exports:
+                symbols[PREFIX + key] = exports
+    return symbols
+
+
+class Symbol(object):
+    '''
+        Destino de um nome e as informações derivadas dele consultadas pelas regras.
+    '''
+    __slots__ = ('target', 'module', 'app', 'key', 'in_models', 'db')
+
+    def __init__(self, target):
+        parts = target.split('.')
+        self.target = target
+        self.module = '.'.join(parts[:-1])
+        self.app = parts[0]
+        self.key = model_key(target)
+        self.in_models = 'models' in parts and 'django' not in parts
+        self.db = target.startswith('django.db')
+
+
+class SymbolTable():
+    '''
+        Resolve os nomes consultando as reexportações do mapa de relacionamentos, então uma regra que
+            recebe o mapa envolvido por cache.Dependencies também registra as reexportações consultadas.
+
+        Cada destino é resolvido uma única vez por tabela.
+    '''
+
+    def __init__(self, relationships=None):
+        self.relationships = relationships or {}
+        self.symbols = {}
+
+    def exports(self, module):
+        for key in (PREFIX + module, '{}{}.__init__'.format(PREFIX, module)):
+            if self.relationships.has_key(key):
+                return self.relationships[key]
+        return None
+
+    def resolve(self, target):
+        '''
+            Segue as reexportações até o módulo que define o nome.
+        '''
+        seen = set()
+        while target not in seen:
+            seen.add(target)
+            module, _, name = target.rpartition('.')
+            exports = module and self.exports(module)
+            if not exports or not exports.has_key(name):
+                break
+            target = exports[name]
+        return target
+
+    def symbol(self, target):
+        if not self.symbols.has_key(target):
+            self.symbols[target] = Symbol(self.resolve(target))
+        return self.symbols[target]
+
+    def imports_db(self, module, source):
+        '''
+            Verifica pelo código fonte se o módulo importa um nome do django.db reexportado por um
+                módulo do projeto (ex.: "from app.models import connection").
+        '''
+        for level, name, names in FROM_IMPORT.findall(source):
+            exports = self.exports(import_module(module, len(level), name))
+            if exports:
+                names = names == '*' and exports.keys() or NAME.findall(names)
+                if any(exports.has_key(item) and self.symbol(exports[item]).db for item in names):
+                    return True
+        return False
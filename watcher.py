@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+# Modo watch (python manage.py watch): mantém o projeto em memória e, a cada arquivo salvo, verifica
+#   novamente somente os módulos alterados e os que dependem deles, exibindo as violações novas e resolvidas.
+
+import os
+import time
+from collections import defaultdict
+from identifier import Identifier
+from converter import SourceToAST
+from checker import iter_violations, complexities
+from cache import MemoryCache
+
+
+def snapshot(files):
+    '''
+        Data de modificação e tamanho de cada arquivo.
+    '''
+    result = {}
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        result[filename] = (stat.st_mtime, stat.st_size)
+    return result
+
+
+def diff_violations(previous, current):
+    '''
+        Violações novas e resolvidas. A linha não faz parte da comparação, para que um trecho
+            inserido acima de uma violação não a apresente como resolvida e novamente encontrada.
+    '''
+    def group(violations):
+        groups = defaultdict(list)
+        for v in violations:
+            groups[(v.smell, v.app, v.key, v.cls, v.method)].append(v)
+        return groups
+
+    before = group(previous)
+    after = group(current)
+    added = []
+    resolved = []
+    for key in set(before) | set(after):
+        old = before.get(key, [])
+        new = after.get(key, [])
+        if len(new) > len(old):
+            lines = set(v.line for v in old)
+            added.extend(sorted(new, key=lambda v: v.line in lines)[:len(new) - len(old)])
+        elif len(old) > len(new):
+            lines = set(v.line for v in new)
+            resolved.extend(sorted(old, key=lambda v: v.line in lines)[:len(old) - len(new)])
+    return added, resolved
+
+
+class Watcher():
+    '''
+        Os arquivos são verificados por polling (os.stat), pois a biblioteca padrão do python 2 não tem inotify.
+
+        Os resultados de cada módulo ficam em um cache em memória (cache.MemoryCache), com as mesmas
+            dependências do cache em disco: um módulo é verificado novamente se o seu código ou os
+            relacionamentos consultados por ele mudarem.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.converter = SourceToAST(config)
+        self.cache = MemoryCache()
+        self.files = {}
+        self.violations = []
+
+    def check(self, identifier):
+        # as complexidades são reaproveitadas somente dentro de uma verificação
+        complexities.clear()
+        layers = identifier.all()
+        nodes = self.converter.load_layers(layers)
+        violations = list(iter_violations(nodes['model'], nodes['view'], nodes['manager'], self.config, self.cache))
+        added, resolved = diff_violations(self.violations, violations)
+        self.violations = violations
+        return added, resolved
+
+    def changes(self):
+        '''
+            Descarta os arquivos alterados, novos ou removidos desde a última verificação.
+            Retorna o Identifier atualizado e os arquivos alterados.
+        '''
+        identifier = Identifier(self.config)
+        files = snapshot(identifier.files)
+        changed = [filename for filename in set(files) | set(self.files) if files.get(filename) != self.files.get(filename)]
+        for filename in changed:
+            self.converter.reload(filename)
+        self.files = files
+        return identifier, changed
+
+    def start(self):
+        identifier, changed = self.changes()
+        start = time.time()
+        self.check(identifier)
+        print(' - {} violações em {} arquivos ({:.2f}s)'.format(len(self.violations), len(changed), time.time() - start))
+        # a análise completa pode usar vários processos, as verificações seguintes são feitas no próprio processo
+        self.config = dict(self.config, jobs='1')
+
+    def step(self):
+        identifier, changed = self.changes()
+        if not changed:
+            return False
+        start = time.time()
+        added, resolved = self.check(identifier)
+        for filename in sorted(changed):
+            print(' * {}'.format(filename))
+        for violation in added:
+            print('   + {}'.format(violation))
+        for violation in resolved:
+            print('   - {}'.format(violation))
+        print(' - {} novas, {} resolvidas, {} violações ({:.2f}s)'.format(len(added), len(resolved), len(self.violations),
+                                                                           time.time() - start))
+        return True
+
+    def run(self, interval):
+        self.start()
+        print(' - Aguardando alterações (Ctrl+C para sair)')
+        try:
+            while True:
+                time.sleep(interval)
+                self.step()
+        except KeyboardInterrupt:
+            pass
+
+
+def watch(config):
+    Watcher(config).run(float(config.get('watch_interval', 0.5)))